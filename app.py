@@ -5,10 +5,17 @@ Design moderne style Skydash Dashboard - Thème clair
 import streamlit as st
 import pandas as pd
 import numpy as np
-import joblib
 import plotly.express as px
 import plotly.graph_objects as go
 from sklearn.preprocessing import StandardScaler
+import profiling
+import scoring
+from prediction_cache import PredictionCache
+from risk_surface import RiskSurface
+from model_bundle import BundleError
+
+# Profilage optionnel de la réexécution (APP_PROFILE=1), panneau en fin de script
+profiler = profiling.start()
 
 # Configuration de la page
 st.set_page_config(
@@ -19,7 +26,7 @@ st.set_page_config(
 )
 
 # CSS personnalisé style Skydash - Thème clair
-st.markdown("""
+APP_CSS = """
 <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css" integrity="sha512-iecdLmaskl7CVkqkXNQ/ZH/XLlvWZOJyj7Yy7tcenmpD1ypASozpmT/E0iPtmFIB46ZmdtAc9eNBvH0H/ZpiBw==" crossorigin="anonymous" referrerpolicy="no-referrer" />
 <style>
     @import url('https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css');
@@ -914,44 +921,154 @@ st.markdown("""
         font-weight: 500;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+with profiling.phase('CSS/HTML'):
+    st.markdown(APP_CSS, unsafe_allow_html=True)
 
 # Chargement des modèles et scalers
 @st.cache_resource
 def load_models():
     """Charge tous les modèles et scalers"""
     try:
-        models = {
-            'BO1': {
-                'model': joblib.load('model_BO1.pkl'),
-                'scaler': joblib.load('scaler_BO1.pkl'),
-                'features': joblib.load('features_BO1.pkl')
-            },
-            'BO2': {
-                'model': joblib.load('model_BO2.pkl'),
-                'scaler': joblib.load('scaler_BO2.pkl'),
-                'features': joblib.load('features_BO2.pkl')
-            },
-            'BO3': {
-                'model': joblib.load('model_BO3.pkl'),
-                'scaler': joblib.load('scaler_BO3.pkl'),
-                'features': joblib.load('features_BO3.pkl'),
-                'top_features': joblib.load('top_5_features_BO3.pkl')
-            },
-            'BO4': {
-                'model': joblib.load('model_BO4.pkl'),
-                'scaler': joblib.load('scaler_BO4.pkl'),
-                'features': joblib.load('features_BO4.pkl'),
-                'cluster_info': pd.read_csv('cluster_info_BO4.csv')
-            }
-        }
-        return models
+        with profiling.phase('chargement des modèles'):
+            return scoring.load_models()
     except FileNotFoundError as e:
         st.error(f"Erreur: Fichier modèle non trouvé. Veuillez d'abord exécuter train_models.py")
         st.stop()
+    except BundleError as e:
+        st.error(f"Erreur: Bundle de modèles invalide ({e}). Veuillez relancer train_models.py")
+        st.stop()
+
+# Cache des prédictions partagé entre les sessions (taille, durée de vie en secondes, arrondi des features)
+PREDICTION_CACHE_SIZE = 1024
+PREDICTION_CACHE_TTL = 3600
+PREDICTION_CACHE_DECIMALS = None
+
+@st.cache_resource
+def get_prediction_cache():
+    """Cache LRU des prédictions d'un seul patient"""
+    return PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_DECIMALS)
+
+@st.cache_resource
+def load_risk_surface():
+    """Surface de scores BO2 précalculée (risk_surface.py), ou None si elle n'a pas été générée"""
+    try:
+        return RiskSurface.load()
+    except FileNotFoundError:
+        return None
+
+# Visuels statiques d'un modèle, construits une fois par version (le paramètre _models n'est pas haché)
+@st.cache_resource
+def bo3_importance_figure(version, _models):
+    """Graphique des 5 features les plus importantes de BO3"""
+    feature_importance = pd.DataFrame({
+        'Feature': _models['BO3']['features'],
+        'Importance': _models['BO3']['model'].feature_importances_
+    }).sort_values('Importance', ascending=False).head(5)
+
+    fig = px.bar(
+        feature_importance, x='Importance', y='Feature', orientation='h',
+        color='Importance', color_continuous_scale='Viridis',
+        text='Importance'
+    )
+    fig.update_traces(
+        texttemplate='%{text:.3f}', textposition='outside',
+        marker=dict(line=dict(color='white', width=2))
+    )
+    fig.update_layout(
+        title=dict(text="Top 5 Facteurs les Plus Prédictifs", font=dict(size=18, color='#2c3e50'), x=0.5),
+        xaxis=dict(title="Importance"),
+        yaxis=dict(title="Facteur"),
+        height=300,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        showlegend=False
+    )
+    return fig
+
+@st.cache_resource
+def bo4_comparison_figure(version, _models):
+    """Comparaison des centres des clusters BO4, sans cluster mis en évidence"""
+    features = _models['BO4']['features']
+    cluster_info = _models['BO4']['cluster_info']
+    fig = go.Figure()
+    colors = ['#5d87ff', '#ffae1f', '#13deb9']
+
+    for i in range(len(cluster_info)):
+        fig.add_trace(go.Scatter(
+            x=features, y=cluster_info.iloc[i],
+            mode='lines+markers',
+            name=f"Cluster {i + 1}",
+            line=dict(width=2, color=colors[i]),
+            marker=dict(size=8, color=colors[i])
+        ))
+
+    fig.update_layout(
+        title=dict(text="Comparaison des Caractéristiques des Clusters", font=dict(size=20, color='#2c3e50'), x=0.5),
+        xaxis=dict(title="Caractéristiques"),
+        yaxis=dict(title="Valeur Moyenne"),
+        height=450,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        hovermode='x unified',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5)
+    )
+    return fig
+
+@st.cache_resource
+def bo4_cluster_table(version, _models):
+    """Tableau comparatif des centres des clusters BO4"""
+    display_cluster_info = _models['BO4']['cluster_info'].round(2)
+    display_cluster_info.index = [f"Cluster {i+1}" for i in range(len(display_cluster_info))]
+    return display_cluster_info
+
+SENSITIVITY_COLORS = {'probabilite': "#5d87ff", 'score': "#5d87ff",
+                      'FAIBLE': "#13deb9", 'MOYEN': "#ffae1f", 'ÉLEVÉ': "#fa896b"}
+SENSITIVITY_TITLES = {'BO1': "Probabilité de risque", 'BO2': "Score de risque", 'BO3': "Probabilité par niveau"}
+
+@st.cache_data(max_entries=256)
+def sensitivity_sweep(version, name, patient_values, factors, _models):
+    """Balayages de sensibilité d'un patient, calculés une fois par version du modèle et saisie
+
+    Les réexécutions sans changement du patient (curseurs what-if, autres widgets) ne
+    rappellent pas le modèle.
+    """
+    return scoring.sensitivity(_models, name, dict(patient_values), list(factors))
+
+def sensitivity_panel(models, name, patient):
+    """Analyse de sensibilité du patient saisi : tous les balayages scorés en un seul appel"""
+    st.markdown("---")
+    st.markdown("""
+    <div class='content-card'>
+        <h3 style='color: #cfcfd0; margin-top: 0;'><i class="fas fa-wave-square"></i> Analyse de Sensibilité</h3>
+    </div>
+    """, unsafe_allow_html=True)
+    candidates = [f for f in scoring.FEATURE_RANGES if f in models[name]['features']]
+    factors = st.multiselect("Facteurs à faire varier", candidates,
+                             default=[f for f in ('sysBP', 'BMI') if f in candidates],
+                             key=f"{name}_sensitivity_factors")
+    if not factors:
+        return
+
+    sweep = sensitivity_sweep(models[name]['version'], name, tuple(sorted(patient.items())), tuple(factors), models)
+    outputs = [c for c in sweep.columns if c not in ('facteur', 'valeur')]
+    cols = st.columns(min(len(factors), 3))
+    for i, factor in enumerate(factors):
+        data = sweep[sweep['facteur'] == factor]
+        with profiling.phase('figures'):
+            fig = go.Figure()
+            for output in outputs:
+                fig.add_trace(go.Scatter(x=data['valeur'], y=data[output], mode='lines', name=output,
+                                         line=dict(color=SENSITIVITY_COLORS[output], width=3)))
+            fig.add_vline(x=patient[factor], line_dash="dash", line_color="#cfcfd0")
+            fig.update_layout(title=dict(text=factor, x=0.5), yaxis_title=SENSITIVITY_TITLES[name],
+                              height=300, showlegend=len(outputs) > 1,
+                              paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+            with cols[i % len(cols)]:
+                st.plotly_chart(fig, use_container_width=True)
 
 # Bouton flottant pour mobile (visible uniquement quand sidebar est fermé)
-st.markdown("""
+MOBILE_TOGGLE_HTML = """
 <div id="mobile-sidebar-toggle" style="position: fixed; top: 1rem; left: 1rem; z-index: 99999; background: #0c7885; border: 1px solid rgba(255,255,255,0.2); color: #ffffff; padding: 0.75rem; border-radius: 6px; cursor: pointer; box-shadow: 0 4px 12px rgba(0,0,0,0.4); width: 56px; height: 56px; display: none; align-items: center; justify-content: center;">
     <i class="fas fa-bars" style="color: #ffffff !important; font-size: 24px;"></i>
 </div>
@@ -988,7 +1105,9 @@ st.markdown("""
         setTimeout(checkSidebarState, 500);
     })();
 </script>
-""", unsafe_allow_html=True)
+"""
+with profiling.phase('CSS/HTML'):
+    st.markdown(MOBILE_TOGGLE_HTML, unsafe_allow_html=True)
 
 # Sidebar avec style Skydash
 st.sidebar.markdown("""
@@ -1001,10 +1120,16 @@ st.sidebar.markdown("""
 page = st.sidebar.radio(
     "Navigation",
     ["Dashboard", "Classification Binaire", "Score Continu", 
-     "Classification Multi-classe", "Clustering"],
+     "Classification Multi-classe", "Clustering", "Analyse par Lot"],
     label_visibility="collapsed"
 )
 
+with st.sidebar.expander("Cache des prédictions"):
+    cache_stats = get_prediction_cache().stats()
+    st.caption(f"Succès : {cache_stats['hits']} · Échecs : {cache_stats['misses']} · "
+               f"Taux : {cache_stats['hit_rate']:.0%}")
+    st.caption(f"Entrées : {cache_stats['size']} / {cache_stats['maxsize']}")
+
 # ========== PAGE DASHBOARD ==========
 if page == "Dashboard":
     st.markdown("""
@@ -1289,9 +1414,8 @@ elif page == "Classification Binaire":
             'currentSmoker': [currentSmoker], 'prevalentHyp': [prevalentHyp], 'diabetes': [diabetes]
         })
         
-        input_scaled = models['BO1']['scaler'].transform(input_data)
-        prediction = models['BO1']['model'].predict(input_scaled)[0]
-        probability = models['BO1']['model'].predict_proba(input_scaled)[0]
+        prediction, probability = scoring.score_cached(get_prediction_cache(), models, 'BO1', input_data)
+        prediction, probability = prediction[0], probability[0]
         
         st.markdown("---")
         
@@ -1319,7 +1443,7 @@ elif page == "Classification Binaire":
                 </div>
                 """, unsafe_allow_html=True)
         
-        with col2:
+        with col2, profiling.phase('figures'):
             fig = go.Figure()
             colors = ['#13deb9', '#fa896b'] if prediction == 0 else ['#fa896b', '#13deb9']
             fig.add_trace(go.Bar(
@@ -1346,6 +1470,12 @@ elif page == "Classification Binaire":
         </div>
         """, unsafe_allow_html=True)
 
+    sensitivity_panel(models, 'BO1', {
+        'age': age, 'sysBP': sysBP, 'diaBP': diaBP, 'totChol': totChol, 'BMI': BMI,
+        'heartRate': heartRate, 'glucose': glucose, 'currentSmoker': currentSmoker,
+        'prevalentHyp': prevalentHyp, 'diabetes': diabetes
+    })
+
 # ========== BO2 : SCORE CONTINU ==========
 elif page == "Score Continu":
     st.markdown("""
@@ -1393,9 +1523,7 @@ elif page == "Score Continu":
             'BMI': [BMI], 'glucose': [glucose]
         })
         
-        input_scaled = models['BO2']['scaler'].transform(input_data)
-        score = models['BO2']['model'].predict(input_scaled)[0]
-        score = max(0, min(100, score))
+        score = scoring.score_cached(get_prediction_cache(), models, 'BO2', input_data)[0]
         
         st.markdown("---")
         
@@ -1429,7 +1557,7 @@ elif page == "Score Continu":
             </div>
             """, unsafe_allow_html=True)
         
-        with col2:
+        with col2, profiling.phase('figures'):
             fig = go.Figure(go.Indicator(
                 mode = "gauge+number+delta",
                 value = score,
@@ -1457,6 +1585,56 @@ elif page == "Score Continu":
         </div>
         """, unsafe_allow_html=True)
 
+    # Exploration what-if : scores lus dans la surface précalculée, sans appel au modèle
+    surface = load_risk_surface()
+    st.markdown("---")
+    st.markdown("""
+    <div class='content-card'>
+        <h3 style='color: #cfcfd0; margin-top: 0;'><i class="fas fa-sliders-h"></i> Exploration What-if</h3>
+    </div>
+    """, unsafe_allow_html=True)
+    if surface is None or surface.version != models['BO2']['version']:
+        st.info("Surface de scores absente ou générée pour une autre version du modèle. "
+                "Exécutez risk_surface.py pour activer l'exploration interactive.")
+    else:
+        form_values = {'age': age, 'sysBP': sysBP, 'totChol': totChol, 'BMI': BMI, 'glucose': glucose}
+        labels = {'age': "Âge", 'sysBP': "Pression Systolique (mmHg)", 'totChol': "Cholestérol Total (mg/dL)",
+                  'BMI': "IMC (kg/m²)", 'glucose': "Glycémie (mg/dL)"}
+        what_if = {}
+        slider_cols = st.columns(len(surface.features))
+        for col, feature in zip(slider_cols, surface.features):
+            low, high = surface.bounds(feature)
+            with col:
+                what_if[feature] = st.slider(labels[feature], low, high,
+                                             float(np.clip(form_values[feature], low, high)),
+                                             key=f"bo2_whatif_{feature}")
+
+        explored = st.selectbox("Variable explorée", surface.features,
+                                format_func=lambda f: labels[f], key="bo2_whatif_feature")
+        values, curve = surface.curve(what_if, explored)
+        what_if_score = surface.score(what_if)
+
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            st.metric("Score estimé", f"{what_if_score:.1f}/100",
+                      delta=f"{what_if_score - surface.score(form_values):+.1f} vs formulaire")
+        with col2, profiling.phase('figures'):
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(x=values, y=curve, mode='lines', line=dict(color="#5d87ff", width=3),
+                                     name="Score estimé"))
+            fig.add_trace(go.Scatter(x=[what_if[explored]], y=[what_if_score], mode='markers',
+                                     marker=dict(size=12, color="#fa896b"), name="Valeur actuelle"))
+            for level in (33, 66):
+                fig.add_hline(y=level, line_dash="dash", line_color="#cfcfd0")
+            fig.update_layout(xaxis_title=labels[explored], yaxis_title="Score de risque",
+                              yaxis_range=[0, 100], height=350,
+                              paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+            st.plotly_chart(fig, use_container_width=True)
+        st.caption("Scores interpolés sur une grille précalculée : valeurs approchées, "
+                   "le bouton de calcul donne le score exact du modèle.")
+
+    sensitivity_panel(models, 'BO2', {'age': age, 'sysBP': sysBP, 'totChol': totChol, 'BMI': BMI, 'glucose': glucose})
+
 # ========== BO3 : CLASSIFICATION MULTI-CLASSE ==========
 elif page == "Classification Multi-classe":
     st.markdown("""
@@ -1528,11 +1706,10 @@ elif page == "Classification Multi-classe":
             'currentSmoker': [currentSmoker], 'prevalentHyp': [prevalentHyp], 'diabetes': [diabetes]
         })
         
-        input_scaled = models['BO3']['scaler'].transform(input_data)
-        prediction = models['BO3']['model'].predict(input_scaled)[0]
-        probabilities = models['BO3']['model'].predict_proba(input_scaled)[0]
+        prediction, probabilities = scoring.score_cached(get_prediction_cache(), models, 'BO3', input_data)
+        prediction, probabilities = prediction[0], probabilities[0]
         
-        risk_levels = {0: "FAIBLE", 1: "MOYEN", 2: "ÉLEVÉ"}
+        risk_levels = scoring.RISK_LEVELS
         risk_colors = {0: "#13deb9", 1: "#ffae1f", 2: "#fa896b"}
         risk_bgs = {0: "#15171a", 1: "#15171a", 2: "#15171a"}
         risk_icons = {0: "check-circle", 1: "exclamation-circle", 2: "exclamation-triangle"}
@@ -1554,7 +1731,7 @@ elif page == "Classification Multi-classe":
             </div>
             """, unsafe_allow_html=True)
         
-        with col2:
+        with col2, profiling.phase('figures'):
             fig = go.Figure(data=[
                 go.Bar(
                     x=['Faible', 'Moyen', 'Élevé'],
@@ -1583,30 +1760,15 @@ elif page == "Classification Multi-classe":
         </div>
         """, unsafe_allow_html=True)
         
-        feature_importance = pd.DataFrame({
-            'Feature': features,
-            'Importance': models['BO3']['model'].feature_importances_
-        }).sort_values('Importance', ascending=False).head(5)
-        
-        fig2 = px.bar(
-            feature_importance, x='Importance', y='Feature', orientation='h',
-            color='Importance', color_continuous_scale='Viridis',
-            text='Importance'
-        )
-        fig2.update_traces(
-            texttemplate='%{text:.3f}', textposition='outside',
-            marker=dict(line=dict(color='white', width=2))
-        )
-        fig2.update_layout(
-            title=dict(text="Top 5 Facteurs les Plus Prédictifs", font=dict(size=18, color='#2c3e50'), x=0.5),
-            xaxis=dict(title="Importance"),
-            yaxis=dict(title="Facteur"),
-            height=300,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            showlegend=False
-        )
-        st.plotly_chart(fig2, use_container_width=True)
+        with profiling.phase('figures'):
+            fig2 = bo3_importance_figure(models['BO3']['version'], models)
+            st.plotly_chart(fig2, use_container_width=True)
+
+    sensitivity_panel(models, 'BO3', {
+        'age': age, 'sysBP': sysBP, 'diaBP': diaBP, 'totChol': totChol, 'BMI': BMI,
+        'heartRate': heartRate, 'glucose': glucose, 'currentSmoker': currentSmoker,
+        'prevalentHyp': prevalentHyp, 'diabetes': diabetes
+    })
 
 # ========== BO4 : CLUSTERING ==========
 elif page == "Clustering":
@@ -1659,8 +1821,7 @@ elif page == "Clustering":
             'BMI': [BMI], 'currentSmoker': [currentSmoker], 'glucose': [glucose]
         })
         
-        input_scaled = models['BO4']['scaler'].transform(input_data)
-        cluster = models['BO4']['model'].predict(input_scaled)[0]
+        cluster = scoring.score_cached(get_prediction_cache(), models, 'BO4', input_data)[0]
         
         st.markdown("---")
         
@@ -1695,31 +1856,11 @@ elif page == "Clustering":
         </div>
         """, unsafe_allow_html=True)
         
-        fig = go.Figure()
-        cluster_names = ['Cluster 1', 'Cluster 2', 'Cluster 3']
-        colors = ['#5d87ff', '#ffae1f', '#13deb9']
-        
-        for i in range(len(cluster_info)):
-            cluster_values = cluster_info.iloc[i]
-            fig.add_trace(go.Scatter(
-                x=features, y=cluster_values,
-                mode='lines+markers',
-                name=cluster_names[i],
-                line=dict(width=4 if i == cluster else 2, color=colors[i]),
-                marker=dict(size=12 if i == cluster else 8, color=colors[i])
-            ))
-        
-        fig.update_layout(
-            title=dict(text="Comparaison des Caractéristiques des Clusters", font=dict(size=20, color='#2c3e50'), x=0.5),
-            xaxis=dict(title="Caractéristiques"),
-            yaxis=dict(title="Valeur Moyenne"),
-            height=450,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            hovermode='x unified',
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5)
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        # Figure de comparaison précalculée : seul le cluster du patient est mis en évidence
+        with profiling.phase('figures'):
+            fig = go.Figure(bo4_comparison_figure(models['BO4']['version'], models))
+            fig.update_traces(line_width=4, marker_size=12, selector=dict(name=f"Cluster {cluster + 1}"))
+            st.plotly_chart(fig, use_container_width=True)
         
         cluster_descriptions = {
             0: "**Cluster 1** : Patients avec profil de risque modéré",
@@ -1735,6 +1876,96 @@ elif page == "Clustering":
         st.markdown("""
         <h3 style='color: #cfcfd0; margin-bottom: 1rem;'><i class="fas fa-table"></i> Tableau Comparatif des Clusters</h3>
         """, unsafe_allow_html=True)
-        display_cluster_info = cluster_info.copy()
-        display_cluster_info.index = [f"Cluster {i+1}" for i in range(len(display_cluster_info))]
-        st.dataframe(display_cluster_info.round(2), use_container_width=True)
+        st.dataframe(bo4_cluster_table(models['BO4']['version'], models), use_container_width=True)
+
+# ========== ANALYSE PAR LOT ==========
+elif page == "Analyse par Lot":
+    st.markdown("""
+    <div class='dashboard-header'>
+        <h1><i class="fas fa-file-csv"></i> Analyse par Lot</h1>
+        <p>Scoring BO1 à BO4 d'une liste complète de patients à partir d'un fichier CSV</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    st.markdown("""
+    <div class='alert alert-info'>
+        <strong><i class="fas fa-info-circle"></i> Format :</strong> Fichier CSV avec les mêmes colonnes que heart_disease.csv. 
+        Les patients sont scorés par blocs, avec un seul appel à chaque modèle par bloc.
+    </div>
+    """, unsafe_allow_html=True)
+    
+    models = load_models()
+    required = scoring.required_features(models)
+    
+    uploaded_file = st.file_uploader("Fichier CSV des patients", type=['csv'])
+    
+    if uploaded_file is not None:
+        batch_data = pd.read_csv(uploaded_file, na_values=scoring.NA_VALUES)
+        missing_cols = [col for col in required if col not in batch_data.columns]
+        
+        if missing_cols:
+            st.error(f"Colonnes manquantes dans le fichier : {', '.join(missing_cols)}")
+        elif st.button("Lancer l'Analyse", type="primary", use_container_width=True):
+            # Valeurs non numériques traitées comme manquantes et signalées
+            batch_data, invalid_rows = scoring.coerce_numeric(batch_data, required)
+            complete = batch_data[required].notna().all(axis=1)
+            n_incomplete = int((~complete).sum())
+            # Avec les médianes d'entraînement, les patients incomplets sont imputés et scorés
+            scored = batch_data if models.medians is not None else batch_data.loc[complete]
+            
+            with st.spinner(f"Scoring de {len(scored)} patients..."):
+                scores = scoring.score_batch(models, scored)
+            results = batch_data.join(scores)
+            
+            if len(invalid_rows):
+                # Numéros de ligne du fichier (ligne 1 : en-tête)
+                lines = ', '.join(str(i + 2) for i in invalid_rows[:10]) + (" ..." if len(invalid_rows) > 10 else "")
+                st.markdown(f"""
+                <div class='alert alert-warning'>
+                    <strong><i class="fas fa-exclamation-triangle"></i> Valeurs invalides :</strong> {len(invalid_rows)} patient(s) avec des valeurs non numériques (lignes {lines}), traitées comme manquantes.
+                </div>
+                """, unsafe_allow_html=True)
+            
+            if n_incomplete and models.medians is not None:
+                st.markdown(f"""
+                <div class='alert alert-info'>
+                    <strong><i class="fas fa-info-circle"></i> Imputation :</strong> {n_incomplete} patient(s) avec des valeurs manquantes ont été complétés par les médianes d'entraînement.
+                </div>
+                """, unsafe_allow_html=True)
+            elif n_incomplete:
+                st.markdown(f"""
+                <div class='alert alert-warning'>
+                    <strong><i class="fas fa-exclamation-triangle"></i> Attention :</strong> {n_incomplete} patient(s) avec des valeurs manquantes n'ont pas été scorés.
+                </div>
+                """, unsafe_allow_html=True)
+            
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Patients scorés", f"{len(scores)}")
+            with col2:
+                st.metric("Haut risque (BO1)", f"{int(scores['BO1_haut_risque'].sum())}")
+            with col3:
+                st.metric("Score moyen (BO2)", f"{scores['BO2_score'].mean():.1f}" if len(scores) else "-")
+            with col4:
+                st.metric("Risque élevé (BO3)", f"{int((scores['BO3_niveau'] == 'ÉLEVÉ').sum())}")
+            
+            st.dataframe(results.head(1000), use_container_width=True)
+            st.download_button(
+                "Télécharger les résultats (CSV)",
+                data=results.to_csv(index=False).encode('utf-8'),
+                file_name="resultats_scoring.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
+
+# ========== PROFILAGE (APP_PROFILE=1) ==========
+if profiler is not None:
+    profile = profiling.finish(page=page)
+    with st.sidebar.expander("Profilage de la réexécution", expanded=True):
+        st.caption(f"Total : {profile['total_ms']:.1f} ms · journal : {profiling.log_path()}")
+        st.caption(f"Objectifs chargés : {', '.join(load_models().loaded()) or 'aucun'}")
+        st.dataframe(pd.DataFrame({
+            'Phase': list(profile['phases_ms']),
+            'ms': list(profile['phases_ms'].values()),
+            'Appels': [profile['calls'].get(name, 0) for name in profile['phases_ms']]
+        }).sort_values('ms', ascending=False), hide_index=True, use_container_width=True)
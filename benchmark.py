@@ -0,0 +1,232 @@
+"""
+Benchmark d'inférence des objectifs BO1 à BO4
+
+Mesure, avec les artefacts chargés comme dans l'application (scoring.load_models) :
+- le temps de chargement à froid de chaque objectif ;
+- la latence d'un patient seul (p50, p99) ;
+- le débit par lot pour plusieurs tailles de lot ;
+- avec --workers, la mémoire de plusieurs processus chargeant les modèles simultanément
+  (privée et proportionnelle, Linux uniquement), pour vérifier le partage des pages
+  du fichier de modèles en mémoire mappée.
+
+Les résultats sont écrits en JSON pour comparer les versions de modèles ; avec --baseline,
+toute dégradation au-delà de --tolerance est signalée et le script sort en erreur.
+
+Usage :
+    python benchmark.py --output benchmark.json
+    python benchmark.py --baseline benchmark.json --output benchmark_new.json --tolerance 0.2
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import sklearn
+import xgboost
+
+import scoring
+
+BENCHMARK_FILE = 'benchmark.json'
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def cold_load(model_dir):
+    """Chargement des modèles puis premier accès à chaque objectif ; renvoie (modèles, temps)"""
+    start = time.perf_counter()
+    models = scoring.load_models(model_dir)
+    timings = {'load_models_s': time.perf_counter() - start, 'objectives_s': {}}
+    for name in scoring.OBJECTIVES:
+        timings['objectives_s'][name] = _timed(lambda: models[name])
+    timings['total_s'] = time.perf_counter() - start
+    return models, timings
+
+
+def single_row_latency(models, name, patients, repeats):
+    """Latence d'appels d'un seul patient, en millisecondes"""
+    score = scoring.SCORERS[name]
+    rows = [patients.iloc[[i % len(patients)]] for i in range(repeats)]
+    for row in rows[:10]:
+        score(models, row)
+    latencies = np.array([_timed(lambda: score(models, row)) for row in rows]) * 1000
+    return {
+        'n': repeats,
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99))
+    }
+
+
+def batch_throughput(models, name, patients, batch_size, min_time=0.5):
+    """Patients scorés par seconde pour des lots de batch_size patients"""
+    score = scoring.SCORERS[name]
+    batch = patients.iloc[np.arange(batch_size) % len(patients)]
+    score(models, batch)
+    n_calls, elapsed = 0, 0.0
+    while elapsed < min_time:
+        elapsed += _timed(lambda: score(models, batch))
+        n_calls += 1
+    return {
+        'batch_size': batch_size,
+        'calls': n_calls,
+        'ms_per_batch': elapsed / n_calls * 1000,
+        'rows_per_s': batch_size * n_calls / elapsed
+    }
+
+
+def _memory_mb(pid='self'):
+    """Mémoire d'un processus en Mo (rss, pss, privée), ou None sans /proc/<pid>/smaps_rollup"""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as f:
+            fields = {line.split(':')[0]: int(line.split()[1]) for line in f if line.endswith('kB\n')}
+    except OSError:
+        return None
+    return {
+        'rss_mb': fields['Rss'] / 1024,
+        'pss_mb': fields['Pss'] / 1024,
+        'private_mb': (fields['Private_Clean'] + fields['Private_Dirty']) / 1024
+    }
+
+
+def _memory_worker(model_dir, patients, barrier, results):
+    models = scoring.load_models(model_dir)
+    for name in scoring.OBJECTIVES:
+        scoring.SCORERS[name](models, patients)
+    # Mesure lorsque tous les processus ont chargé les modèles, avant que l'un d'eux ne se termine
+    barrier.wait()
+    results.put(_memory_mb())
+    barrier.wait()
+
+
+def worker_memory(model_dir, patients, workers):
+    """Mémoire moyenne par processus lorsque workers processus scorent en même temps"""
+    context = multiprocessing.get_context('spawn')
+    barrier, results = context.Barrier(workers), context.Queue()
+    processes = [context.Process(target=_memory_worker, args=(model_dir, patients, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measures = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    if None in measures:
+        return None
+    return {'workers': workers, **{key: float(np.mean([m[key] for m in measures])) for key in measures[0]}}
+
+
+def run(model_dir='.', data_path=scoring.TRAINING_DATA, repeats=200, batch_sizes=BATCH_SIZES, workers=0):
+    models, load_timings = cold_load(model_dir)
+    data = pd.read_csv(data_path, na_values=scoring.NA_VALUES)
+    medians = models.medians if models.medians is not None else scoring.fit_medians(data)
+    patients = scoring.impute(data[scoring.required_features(models)], medians)
+
+    results = {}
+    for name in scoring.OBJECTIVES:
+        print(f"Benchmark {name}...")
+        results[name] = {
+            'version': models[name]['version'],
+            'model': type(models[name]['model']).__name__,
+            'single_row': single_row_latency(models, name, patients, repeats),
+            'throughput': [batch_throughput(models, name, patients, size) for size in batch_sizes]
+        }
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'xgboost': xgboost.__version__
+        },
+        'cold_load': load_timings,
+        'objectives': results
+    }
+    if workers:
+        print(f"Mémoire de {workers} processus...")
+        report['worker_memory'] = worker_memory(model_dir, patients.head(100), workers)
+    return report
+
+
+def regressions(report, baseline, tolerance):
+    """Mesures plus lentes que la référence de plus de tolerance (0.2 = 20 %)"""
+    found = []
+    for name, current in report['objectives'].items():
+        reference = baseline['objectives'].get(name)
+        if reference is None:
+            continue
+        for key in ('p50_ms', 'p99_ms'):
+            if current['single_row'][key] > reference['single_row'][key] * (1 + tolerance):
+                found.append(f"{name} {key} : {reference['single_row'][key]:.3f} -> {current['single_row'][key]:.3f}")
+        reference_rates = {t['batch_size']: t['rows_per_s'] for t in reference['throughput']}
+        for t in current['throughput']:
+            rate = reference_rates.get(t['batch_size'])
+            if rate and t['rows_per_s'] < rate * (1 - tolerance):
+                found.append(f"{name} débit lot {t['batch_size']} : {rate:.0f} -> {t['rows_per_s']:.0f} patients/s")
+    return found
+
+
+def print_report(report):
+    print(f"\nChargement à froid : {report['cold_load']['total_s'] * 1000:.0f} ms")
+    for name, result in report['objectives'].items():
+        single = result['single_row']
+        rates = ', '.join(f"{t['batch_size']}: {t['rows_per_s']:.0f}/s" for t in result['throughput'])
+        print(f"{name} ({result['model']}) chargement {report['cold_load']['objectives_s'][name] * 1000:.0f} ms | "
+              f"p50 {single['p50_ms']:.2f} ms | p99 {single['p99_ms']:.2f} ms | débit {rates}")
+    memory = report.get('worker_memory')
+    if memory:
+        print(f"Mémoire par processus ({memory['workers']} processus) : RSS {memory['rss_mb']:.1f} Mo | "
+              f"PSS {memory['pss_mb']:.1f} Mo | privée {memory['private_mb']:.1f} Mo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark d'inférence BO1 à BO4")
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--data', default=scoring.TRAINING_DATA, help="patients utilisés pour les mesures")
+    parser.add_argument('--output', default=BENCHMARK_FILE)
+    parser.add_argument('--repeats', type=int, default=200, help="appels d'un seul patient mesurés")
+    parser.add_argument('--batch-sizes', default=','.join(map(str, BATCH_SIZES)))
+    parser.add_argument('--workers', type=int, default=0,
+                        help="processus simultanés pour mesurer la mémoire par processus (0 : pas de mesure)")
+    parser.add_argument('--baseline', default=None, help="résultats de référence à comparer")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="dégradation tolérée par rapport à la référence (0.2 = 20 %%)")
+    args = parser.parse_args()
+
+    report = run(args.model_dir, args.data, args.repeats, [int(s) for s in args.batch_sizes.split(',')],
+                 args.workers)
+    print_report(report)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        found = regressions(report, baseline, args.tolerance)
+        report['regressions'] = found
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nRésultats écrits dans {args.output}")
+
+    if args.baseline:
+        if found:
+            print("\n⚠️ Régressions détectées :")
+            for line in found:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\n✅ Aucune régression par rapport à la référence")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+"""
+Modèles compilés en tableaux NumPy contigus pour une inférence vectorisée
+
+Les modèles XGBoost (BO1, BO2) sont exportés au format natif de XGBoost (.ubj) et
+évalués par inplace_predict, sans le wrapper sklearn.
+
+Contient aussi la fusion du StandardScaler dans les modèles (fuse_scaler) : les seuils
+des arbres et les centres des clusters sont ramenés dans l'espace des valeurs brutes,
+les patients sont alors scorés sans étape de normalisation.
+
+Usage (export d'un modèle existant) :
+    python compiled_models.py model_BO3.pkl model_BO3_compiled.npz
+    python compiled_models.py model_BO1.pkl model_BO1.ubj
+"""
+import argparse
+import io
+import json
+
+import joblib
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.ensemble import RandomForestClassifier
+from xgboost import Booster, XGBModel
+
+# Nombre de patients évalués à la fois, pour borner la mémoire intermédiaire
+EVAL_BLOCK_SIZE = 2048
+# À partir de cette taille de lot, la forêt sklearn (boucles C) est plus rapide que
+# l'évaluation NumPy : les lots sont alors confiés au modèle d'origine s'il est disponible
+SKLEARN_MIN_ROWS = 1024
+# Nombre de patients affectés à la fois aux centres des clusters (un produit matriciel par bloc)
+ASSIGN_BLOCK_SIZE = 65536
+
+
+class CompiledForest:
+    """Forêt aléatoire de classification aplatie en tableaux NumPy
+
+    Les nœuds de tous les arbres sont concaténés ; les enfants du nœud i sont rangés en
+    2i (gauche) et 2i+1 (droite) et une feuille pointe sur elle-même, ce qui permet de
+    descendre tous les arbres pour tout un bloc de patients en max_depth étapes
+    vectorisées. Se comporte comme le RandomForestClassifier d'origine (predict,
+    predict_proba, classes_, feature_importances_) et donne les mêmes probabilités.
+
+    Le compilé sert aux petits lots et au patient seul. Les lots d'au moins
+    SKLEARN_MIN_ROWS patients sont évalués par le RandomForestClassifier d'origine
+    (estimator : modèle, chemin du pickle ou octets joblib, chargé au premier gros lot).
+    """
+
+    # Forêts picklées avant l'ajout du modèle d'origine : évaluation compilée uniquement
+    estimator = None
+    input_scaling = None
+
+    def __init__(self, feature, threshold, children, missing_left, value, roots, max_depth,
+                 classes, feature_importances, estimator=None, input_scaling=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+        self.feature_importances_ = feature_importances
+        self.estimator = estimator
+        # (mean, scale) d'une forêt fusionnée : le modèle d'origine attend des features normalisées
+        self.input_scaling = input_scaling
+
+    def __getstate__(self):
+        # Modèle d'origine gardé sérialisé : dépicklé seulement si un gros lot est scoré
+        state = self.__dict__.copy()
+        if isinstance(self.estimator, str):
+            with open(self.estimator, 'rb') as f:
+                state['estimator'] = f.read()
+        elif self.estimator is not None and not isinstance(self.estimator, bytes):
+            buffer = io.BytesIO()
+            joblib.dump(self.estimator, buffer)
+            state['estimator'] = buffer.getvalue()
+        return state
+
+    def _sklearn_estimator(self):
+        if isinstance(self.estimator, str):
+            self.estimator = joblib.load(self.estimator)
+        elif isinstance(self.estimator, bytes):
+            self.estimator = joblib.load(io.BytesIO(self.estimator))
+        return self.estimator
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Aplatit un RandomForestClassifier entraîné"""
+        features, thresholds, children, missing_left, values, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left < 0
+            roots.append(offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(_float32_threshold(np.where(is_leaf, 0.0, tree.threshold)))
+            left = np.where(is_leaf, nodes, tree.children_left) + offset
+            right = np.where(is_leaf, nodes, tree.children_right) + offset
+            children.append(np.stack([left, right], axis=1).ravel())
+            missing_left.append(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=bool)))
+            value = tree.value[:, 0, :]
+            values.append(value / value.sum(axis=1, keepdims=True))
+            offset += tree.node_count
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds),
+            children=np.concatenate(children).astype(np.int32),
+            missing_left=np.concatenate(missing_left).astype(bool),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max(e.tree_.max_depth for e in model.estimators_),
+            classes=model.classes_,
+            feature_importances=model.feature_importances_,
+            estimator=model
+        )
+
+    def _leaves(self, X):
+        """Indice de la feuille atteinte dans chaque arbre, forme (n_patients, n_arbres)"""
+        n_samples, n_features = X.shape
+        flat = X.ravel()
+        row_offset = (np.arange(n_samples, dtype=np.intp) * n_features)[:, None]
+        has_missing = np.isnan(flat).any()
+        node = np.broadcast_to(self.roots.astype(np.intp), (n_samples, len(self.roots)))
+        for _ in range(self.max_depth):
+            x = np.take(flat, row_offset + np.take(self.feature, node))
+            go_right = x > np.take(self.threshold, node)
+            if has_missing:
+                go_right |= np.isnan(x) & ~np.take(self.missing_left, node)
+            node = np.take(self.children, 2 * node + go_right)
+        return node
+
+    def predict_proba(self, X):
+        if len(X) >= SKLEARN_MIN_ROWS and self.estimator is not None:
+            X = np.asarray(X, dtype=np.float64)
+            if self.input_scaling is not None:
+                mean, scale = self.input_scaling
+                X = (X - mean) / scale
+            return self._sklearn_estimator().predict_proba(X)
+        # float32 comme sklearn, ou float64 pour une forêt fusionnée avec son scaler
+        X = np.ascontiguousarray(X, dtype=self.threshold.dtype)
+        proba = np.empty((len(X), self.value.shape[1]))
+        for start in range(0, len(X), EVAL_BLOCK_SIZE):
+            block = X[start:start + EVAL_BLOCK_SIZE]
+            proba[start:start + len(block)] = np.take(self.value, self._leaves(block), axis=0).mean(axis=1)
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+    def fused(self, mean, scale):
+        """Forêt équivalente prenant les features brutes : chaque seuil est dé-normalisé"""
+        # Gauche si scaled(x) <= seuil : le seuil brut est le plus grand x qui va encore à gauche.
+        # Il reste en float64 : deux valeurs brutes peuvent être séparées d'un seul float32 normalisé
+        threshold = _raw_threshold(self.threshold, mean[self.feature], scale[self.feature], strict=False)
+        return CompiledForest(self.feature, threshold, self.children, self.missing_left,
+                              self.value, self.roots, self.max_depth, self.classes_,
+                              self.feature_importances_, self.estimator, (mean, scale))
+
+    def save(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold, children=self.children,
+                 missing_left=self.missing_left, value=self.value, roots=self.roots,
+                 max_depth=self.max_depth, classes=self.classes_,
+                 feature_importances=self.feature_importances_)
+
+    @classmethod
+    def load(cls, path, estimator=None):
+        """Forêt enregistrée par save ; estimator : modèle d'origine pour les gros lots (ex. son pickle)"""
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files}, estimator=estimator)
+
+
+class FusedKMeans:
+    """KMeans dont la normalisation est intégrée aux centres
+
+    La distance dans l'espace normalisé est une distance pondérée par 1/scale² dans
+    l'espace brut : ||x||² - 2·x·(w·c_k) + ||w·c_k||², dont seuls les deux derniers termes
+    dépendent du centre. Les normes des centres sont précalculées et l'affectation d'un
+    bloc de patients se fait en un seul produit matriciel. Les centres bruts peuvent venir
+    du modèle ou de cluster_info_BO4.csv, avec les paramètres du scaler.
+    """
+
+    def __init__(self, centers, weights):
+        self.cluster_centers_ = centers
+        self.weights = weights
+        self._weighted_centers = centers * weights
+        self._center_norms = (self._weighted_centers * centers).sum(axis=1)
+
+    def _blocks(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        for start in range(0, len(X), ASSIGN_BLOCK_SIZE):
+            yield start, X[start:start + ASSIGN_BLOCK_SIZE]
+
+    def predict(self, X):
+        labels = np.empty(len(X), dtype=np.int32)
+        for start, block in self._blocks(X):
+            # ||x||² est commun à tous les centres : inutile pour l'argmin
+            labels[start:start + len(block)] = (self._center_norms - 2 * block @ self._weighted_centers.T).argmin(axis=1)
+        return labels
+
+    def transform(self, X):
+        """Distance de chaque patient à chaque centre, dans l'espace normalisé (comme KMeans.transform)"""
+        distances = np.empty((len(X), len(self.cluster_centers_)))
+        for start, block in self._blocks(X):
+            squared = self._center_norms - 2 * block @ self._weighted_centers.T
+            squared += (block * block) @ self.weights[:, None]
+            # Les arrondis peuvent rendre négatif un carré nul
+            np.maximum(squared, 0, out=squared)
+            np.sqrt(squared, out=distances[start:start + len(block)])
+        return distances
+
+    def assign(self, X):
+        """Renvoie (cluster, distances à chaque centre, marge entre les deux centres les plus proches)"""
+        distances = self.transform(X)
+        nearest = np.partition(distances, 1, axis=1)[:, :2]
+        return distances.argmin(axis=1).astype(np.int32), distances, nearest[:, 1] - nearest[:, 0]
+
+
+class NativeBooster:
+    """Booster XGBoost seul, enregistré au format binaire natif (.ubj)
+
+    Le fichier ne dépend ni de pickle ni de la version de sklearn. Les prédictions passent
+    par inplace_predict directement sur le tableau NumPy, sans DMatrix ni wrapper sklearn,
+    avec les mêmes valeurs que XGBClassifier (binaire) ou XGBRegressor.
+    """
+
+    def __init__(self, booster):
+        self.booster = booster
+        objective = json.loads(booster.save_config())['learner']['objective']['name']
+        self.is_classifier = objective.startswith('binary:')
+
+    @classmethod
+    def from_xgboost(cls, model):
+        """Booster d'un XGBClassifier ou XGBRegressor entraîné"""
+        return cls(model.get_booster())
+
+    def get_booster(self):
+        return self.booster
+
+    def predict_proba(self, X):
+        positive = self.booster.inplace_predict(np.asarray(X))
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, X):
+        prediction = self.booster.inplace_predict(np.asarray(X))
+        return (prediction > 0.5).astype(np.int64) if self.is_classifier else prediction
+
+    def save(self, path):
+        self.booster.save_model(path)
+
+    @classmethod
+    def load(cls, path):
+        return cls(Booster(model_file=path))
+
+
+def _map_xgboost_splits(model, map_fn):
+    """Copie d'un modèle XGBoost dont les seuils de split passent par map_fn(seuils, features)"""
+    dump = json.loads(model.get_booster().save_raw('json'))
+    for tree in dump['learner']['gradient_booster']['model']['trees']:
+        conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+        indices = np.asarray(tree['split_indices'])
+        internal = np.asarray(tree['left_children']) >= 0
+        conditions[internal] = map_fn(conditions[internal], indices[internal]).astype(np.float32)
+        tree['split_conditions'] = conditions.tolist()
+    raw = bytearray(json.dumps(dump).encode('utf-8'))
+    if isinstance(model, NativeBooster):
+        return NativeBooster(Booster(model_file=raw))
+    mapped = type(model)(**model.get_params())
+    mapped.load_model(raw)
+    return mapped
+
+
+def _fuse_xgboost(model, mean, scale):
+    """Copie d'un modèle XGBoost dont les seuils de split sont exprimés en valeurs brutes"""
+    # Gauche si scaled(x) < condition : la condition brute est le plus petit x qui va à droite
+    return _map_xgboost_splits(
+        model, lambda threshold, i: _raw_threshold(threshold, mean[i], scale[i], strict=True)
+    )
+
+
+def rescale_xgboost(model, old_scaler, new_scaler):
+    """Copie d'un modèle XGBoost entraîné avec old_scaler, à utiliser avec new_scaler
+
+    Chaque seuil est ramené en valeur brute puis normalisé avec les nouveaux paramètres :
+    les décisions sont conservées, aux arrondis float32 près.
+    """
+    def rescale(threshold, i):
+        raw = _raw_threshold(threshold, old_scaler.mean_[i], old_scaler.scale_[i], strict=True)
+        return (raw - new_scaler.mean_[i]) / new_scaler.scale_[i]
+    return _map_xgboost_splits(model, rescale)
+
+
+def _raw_threshold(threshold, mean, scale, strict):
+    """Seuils bruts donnant la même décision que les seuils normalisés
+
+    La décision d'origine porte sur float32((x - mean) / scale) < seuil (strict, XGBoost)
+    ou <= seuil (sklearn), x étant la valeur brute en float64. La normalisation étant
+    croissante, la frontière en valeur brute est trouvée par dichotomie vectorisée, puis
+    renvoyée en float64 (XGBoost la convertit en float32 comme ses features).
+    """
+    threshold = np.asarray(threshold, dtype=np.float32)
+
+    def goes_left(x):
+        scaled = ((x - mean) / scale).astype(np.float32)
+        return scaled < threshold if strict else scaled <= threshold
+
+    estimate = threshold.astype(np.float64) * scale + mean
+    delta = np.maximum(np.abs(estimate), 1.0) * 1e-4
+    low, high = estimate - delta, estimate + delta
+    for _ in range(64):
+        middle = (low + high) / 2
+        left = goes_left(middle)
+        low = np.where(left, middle, low)
+        high = np.where(left, high, middle)
+    # strict : plus petite valeur allant à droite ; sinon plus grande valeur allant à gauche
+    return high if strict else low
+
+
+def fuse_scaler(model, scaler):
+    """Intègre un StandardScaler au modèle : le modèle renvoyé prend les features brutes
+
+    Les résultats sont identiques à scaler puis modèle, aux arrondis près pour les
+    valeurs situées exactement sur un seuil de split.
+    """
+    mean, scale = scaler.mean_, scaler.scale_
+    if isinstance(model, RandomForestClassifier):
+        model = CompiledForest.from_sklearn(model)
+    if isinstance(model, CompiledForest):
+        return model.fused(mean, scale)
+    if isinstance(model, (XGBModel, NativeBooster)):
+        return _fuse_xgboost(model, mean, scale)
+    if isinstance(model, (KMeans, MiniBatchKMeans)):
+        return FusedKMeans(model.cluster_centers_ * scale + mean, 1 / scale ** 2)
+    raise TypeError(f"Fusion du scaler non supportée pour {type(model).__name__}")
+
+
+def _float32_threshold(threshold):
+    """Seuils float32 équivalents aux seuils float64 de sklearn
+
+    sklearn compare des features converties en float32 à des seuils float64 ; le plus
+    grand float32 inférieur ou égal au seuil donne exactement la même décision, avec
+    des comparaisons et des tableaux deux fois plus légers.
+    """
+    threshold32 = threshold.astype(np.float32)
+    above = threshold32.astype(np.float64) > threshold
+    threshold32[above] = np.nextafter(threshold32[above], np.float32(-np.inf))
+    return threshold32
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile une forêt aléatoire ou exporte un booster XGBoost")
+    parser.add_argument('model', help="RandomForestClassifier ou modèle XGBoost sauvegardé avec joblib")
+    parser.add_argument('output', help="fichier .npz (forêt) ou .ubj (booster natif) de sortie")
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    if isinstance(model, XGBModel):
+        NativeBooster.from_xgboost(model).save(args.output)
+        print(f"Booster natif sauvegardé dans {args.output}")
+    else:
+        CompiledForest.from_sklearn(model).save(args.output)
+        print(f"Forêt compilée sauvegardée dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
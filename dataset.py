@@ -0,0 +1,126 @@
+"""
+Cache colonnaire typé du jeu de données d'entraînement
+
+Le CSV est lu une seule fois puis chaque colonne est enregistrée en .npy : les colonnes
+numériques avec leur type d'origine, les colonnes texte (Gender, education,
+prevalentStroke, Heart_ stroke) en codes entiers avec la liste de leurs catégories. Le
+cache est invalidé par l'empreinte SHA-256 du CSV source.
+
+Usage :
+    python dataset.py                 # (re)construit le cache de heart_disease.csv
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import scoring
+
+CACHE_DIR = '.dataset_cache'
+CACHE_MANIFEST = 'manifest.json'
+CACHE_FORMAT_VERSION = 1
+
+
+def file_hash(path):
+    """Empreinte SHA-256 d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_path(path, cache_dir):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir or os.path.join(os.path.dirname(path), CACHE_DIR), name)
+
+
+def build_cache(path, cache_dir=None, source_hash=None):
+    """Lit le CSV et écrit une colonne par fichier .npy ; renvoie le DataFrame lu"""
+    data = pd.read_csv(path, na_values=scoring.NA_VALUES)
+    target = _cache_path(path, cache_dir)
+    tmp = f"{target}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    columns = []
+    for i, column in enumerate(data.columns):
+        values = data[column]
+        description = {'name': column, 'file': f"{i}.npy"}
+        if pd.api.types.is_numeric_dtype(values):
+            array = values.to_numpy()
+        else:
+            # Codes entiers (-1 pour une valeur manquante) et liste des catégories
+            categorical = pd.Categorical(values)
+            array = categorical.codes
+            description['categories'] = [str(c) for c in categorical.categories]
+        np.save(os.path.join(tmp, description['file']), array)
+        columns.append(description)
+
+    manifest = {
+        'format_version': CACHE_FORMAT_VERSION,
+        'source_sha256': source_hash or file_hash(path),
+        'n_rows': len(data),
+        'columns': columns
+    }
+    # Manifeste écrit en dernier puis renommage : un cache incomplet n'est jamais lu
+    with open(os.path.join(tmp, CACHE_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return data
+
+
+def _read_cache(target, source_hash):
+    """DataFrame reconstruit depuis le cache, ou None si absent ou périmé"""
+    try:
+        with open(os.path.join(target, CACHE_MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (manifest.get('format_version') != CACHE_FORMAT_VERSION
+            or manifest.get('source_sha256') != source_hash):
+        return None
+
+    data = {}
+    for description in manifest['columns']:
+        array = np.load(os.path.join(target, description['file']))
+        if 'categories' in description:
+            array = pd.Categorical.from_codes(array, description['categories'])
+        data[description['name']] = array
+    return pd.DataFrame(data)
+
+
+def load_dataset(path=scoring.TRAINING_DATA, cache_dir=None, use_cache=True):
+    """Charge le jeu de données depuis le cache colonnaire, reconstruit si le CSV a changé
+
+    Les colonnes texte sont renvoyées en type category : les opérations .str ne portent
+    alors que sur les catégories distinctes.
+    """
+    if not use_cache:
+        return pd.read_csv(path, na_values=scoring.NA_VALUES)
+    source_hash = file_hash(path)
+    data = _read_cache(_cache_path(path, cache_dir), source_hash)
+    if data is None:
+        data = build_cache(path, cache_dir, source_hash)
+        data = _read_cache(_cache_path(path, cache_dir), source_hash)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construit le cache colonnaire d'un CSV patients")
+    parser.add_argument('path', nargs='?', default=scoring.TRAINING_DATA)
+    parser.add_argument('--cache-dir', default=None)
+    args = parser.parse_args()
+
+    data = build_cache(args.path, args.cache_dir)
+    print(f"✅ Cache de {len(data)} lignes x {data.shape[1]} colonnes écrit dans "
+          f"{_cache_path(args.path, args.cache_dir)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+Bundle de modèles versionné : un seul fichier pour les quatre objectifs métier
+
+Format du fichier :
+    MAGIC (8 octets) | taille du manifeste (uint64 little-endian) | manifeste JSON | blocs
+
+Le manifeste décrit chaque objectif (features, paramètres du scaler, centres des
+clusters, position, taille et empreinte SHA-256 de son bloc) ainsi que les médianes
+d'imputation et les métadonnées d'entraînement. Chaque bloc contient le modèle et le scaler sérialisés avec joblib ;
+pour un modèle fusionné (compiled_models.fuse_scaler), le scaler vaut None et ses
+paramètres ne restent dans le manifeste qu'à titre informatif.
+
+Les fichiers partagés (save_shared, load_shared) contiennent les mêmes objectifs en
+joblib non compressé, un fichier par objectif : leurs tableaux NumPy sont projetés en
+mémoire, et les processus qui les ouvrent partagent les mêmes pages physiques.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+from datetime import datetime, timezone
+
+import joblib
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from xgboost import XGBModel
+
+from compiled_models import CompiledForest, NativeBooster
+
+BUNDLE_FILE = 'models_bundle.bin'
+SHARED_DIR = 'models_shared'
+SHARED_MANIFEST = 'manifest.json'
+SHARED_FORMAT_VERSION = 1
+MAGIC = b'HDBUNDLE'
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<8sQ')
+
+
+class BundleError(ValueError):
+    """Bundle illisible, incomplet ou corrompu"""
+
+
+def _dumps(obj):
+    buffer = io.BytesIO()
+    joblib.dump(obj, buffer)
+    return buffer.getvalue()
+
+
+def save_bundle(models, path=BUNDLE_FILE, metadata=None, medians=None):
+    """Écrit les modèles dans un bundle unique, de façon atomique (fichier temporaire puis renommage)"""
+    blobs = []
+    objectives = {}
+    offset = 0
+    for name, entry in models.items():
+        fused = entry.get('fused', False)
+        blob = _dumps({'model': entry['model'], 'scaler': None if fused else entry['scaler']})
+        description = {
+            'features': list(entry['features']),
+            'scaler': {'mean': entry['scaler'].mean_.tolist(), 'scale': entry['scaler'].scale_.tolist()},
+            'offset': offset,
+            'length': len(blob),
+            'sha256': hashlib.sha256(blob).hexdigest(),
+            'fused': fused
+        }
+        if 'top_features' in entry:
+            description['top_features'] = list(entry['top_features'])
+        if 'cluster_info' in entry:
+            description['cluster_centers'] = entry['cluster_info'][entry['features']].values.tolist()
+        objectives[name] = description
+        blobs.append(blob)
+        offset += len(blob)
+
+    version = hashlib.sha256(''.join(d['sha256'] for d in objectives.values()).encode()).hexdigest()[:12]
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'model_version': version,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'training': metadata or {},
+        'imputation_medians': None if medians is None else {k: float(v) for k, v in medians.items()},
+        'objectives': objectives
+    }
+    header = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def _parse_header(data):
+    if len(data) < _HEADER.size:
+        raise BundleError("bundle tronqué")
+    magic, header_size = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise BundleError("fichier qui n'est pas un bundle de modèles")
+    start = _HEADER.size + header_size
+    manifest = json.loads(bytes(data[_HEADER.size:start]).decode('utf-8'))
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise BundleError(f"version de format non supportée : {manifest.get('format_version')}")
+    return manifest, start
+
+
+def _entry_from_blob(description, blob, version):
+    """Reconstruit l'entrée d'un objectif au format de scoring.load_models"""
+    if hashlib.sha256(blob).hexdigest() != description['sha256']:
+        raise BundleError("empreinte SHA-256 invalide, bundle corrompu")
+    entry = joblib.load(io.BytesIO(blob))
+    entry['features'] = description['features']
+    entry['version'] = version
+    entry['fused'] = description.get('fused', False)
+    if 'top_features' in description:
+        entry['top_features'] = description['top_features']
+    if 'cluster_centers' in description:
+        entry['cluster_info'] = pd.DataFrame(description['cluster_centers'], columns=description['features'])
+    return entry
+
+
+class BundleReader:
+    """Accès objectif par objectif à un bundle, sans lire les autres blocs
+
+    Le fichier n'est ouvert que le temps de lire le manifeste, puis d'un bloc : sous
+    Windows, un nouvel entraînement peut donc remplacer le bundle pendant que
+    l'application tourne. Un bundle remplacé entre-temps lève BundleError au chargement
+    suivant d'un objectif ; scoring.LazyModels rouvre alors le bundle et recharge les modèles.
+    """
+
+    def __init__(self, path=BUNDLE_FILE):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.manifest, self._start = self._read_header(f)
+
+    @staticmethod
+    def _read_header(f):
+        prefix = f.read(_HEADER.size)
+        if len(prefix) < _HEADER.size:
+            raise BundleError("bundle tronqué")
+        _, header_size = _HEADER.unpack(prefix)
+        return _parse_header(prefix + f.read(header_size))
+
+    def load(self, name):
+        """Charge un seul objectif en ne lisant que son bloc"""
+        description = self.manifest['objectives'][name]
+        with open(self.path, 'rb') as f:
+            manifest, start = self._read_header(f)
+            if manifest['model_version'] != self.manifest['model_version']:
+                raise BundleError("bundle remplacé depuis son ouverture, modèles à recharger")
+            f.seek(start + description['offset'])
+            blob = f.read(description['length'])
+        return _entry_from_blob(description, blob, self.manifest['model_version'])
+
+
+def _shareable(model):
+    """Forme du modèle dont les données sont des tableaux NumPy projetables en mémoire"""
+    if isinstance(model, RandomForestClassifier):
+        return CompiledForest.from_sklearn(model)
+    if isinstance(model, XGBModel):
+        # Le booster est reconstruit par XGBoost dans chaque processus : pas de partage possible
+        return NativeBooster.from_xgboost(model)
+    return model
+
+
+def save_shared(models, shared_dir=SHARED_DIR, version=None, medians=None):
+    """Écrit les modèles en un fichier joblib par objectif, lisibles en mémoire mappée
+
+    Forêt compilée, centres des clusters et paramètres des scalers y sont des tableaux
+    NumPy bruts. Les fichiers d'une version sont rangés dans shared_dir/<version>/ et le
+    manifeste JSON, écrit en dernier par renommage atomique, désigne la version courante.
+    La version précédente est conservée pour les processus qui ne l'ont pas encore
+    entièrement chargée ; les plus anciennes sont supprimées.
+    """
+    manifest_path = os.path.join(shared_dir, SHARED_MANIFEST)
+    previous = read_shared_manifest(shared_dir) if os.path.exists(manifest_path) else None
+    os.makedirs(os.path.join(shared_dir, version), exist_ok=True)
+
+    objectives = {}
+    for name, entry in models.items():
+        fused = entry.get('fused', False)
+        content = {
+            'model': _shareable(entry['model']),
+            'scaler': None if fused else entry['scaler'],
+            'features': list(entry['features']),
+            'fused': fused
+        }
+        for key in ('top_features', 'cluster_info'):
+            if key in entry:
+                content[key] = entry[key]
+        objectives[name] = f"{version}/{name}.joblib"
+        # Renommage : un fichier déjà projeté par un autre processus n'est jamais réécrit en place
+        path = os.path.join(shared_dir, objectives[name])
+        joblib.dump(content, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    manifest = {
+        'format_version': SHARED_FORMAT_VERSION,
+        'model_version': version,
+        'imputation_medians': None if medians is None else {k: float(v) for k, v in medians.items()},
+        'objectives': objectives
+    }
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+    keep = {version, previous and previous['model_version']}
+    for entry in os.scandir(shared_dir):
+        if entry.is_dir() and entry.name not in keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    return manifest
+
+
+def read_shared_manifest(shared_dir=SHARED_DIR):
+    """Manifeste JSON des fichiers partagés : version, médianes et fichier de chaque objectif"""
+    try:
+        with open(os.path.join(shared_dir, SHARED_MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except ValueError as e:
+        raise BundleError(f"manifeste des modèles partagés illisible ({e})")
+    if manifest.get('format_version') != SHARED_FORMAT_VERSION:
+        raise BundleError(f"version de format non supportée : {manifest.get('format_version')}")
+    return manifest
+
+
+def load_shared(manifest, name, shared_dir=SHARED_DIR):
+    """Ouvre un seul objectif en mémoire mappée
+
+    Les tableaux sont en lecture seule et leurs pages ne sont lues qu'à l'utilisation ;
+    tous les processus qui ouvrent le même fichier partagent ces pages.
+    """
+    entry = joblib.load(os.path.join(shared_dir, manifest['objectives'][name]), mmap_mode='r')
+    entry['version'] = manifest['model_version']
+    return entry
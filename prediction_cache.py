@@ -0,0 +1,71 @@
+"""
+Cache LRU borné avec durée de vie pour les prédictions d'un seul patient
+
+Clé : (objectif, version du modèle, valeurs des features, éventuellement arrondies).
+Un changement de version du modèle rend donc automatiquement les anciennes entrées
+inutilisables ; elles sortent du cache par l'ordre LRU ou à expiration.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Cache LRU de taille maximale maxsize dont les entrées expirent après ttl secondes
+
+    Avec decimals, les features sont arrondies avant de former la clé (et avant le
+    calcul), ce qui regroupe les saisies quasi identiques sur une même entrée.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600.0, decimals=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def normalize(self, values):
+        """Valeurs des features telles qu'utilisées dans la clé et pour le calcul"""
+        values = tuple(float(v) for v in values)
+        if self.decimals is None:
+            return values
+        return tuple(round(v, self.decimals) for v in values)
+
+    def get_or_compute(self, key, compute):
+        """Renvoie la valeur en cache pour key, ou la calcule avec compute() et la mémorise"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Compteurs pour dimensionner le cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl
+            }
@@ -0,0 +1,100 @@
+"""
+Profilage des réexécutions de l'application Streamlit (mode optionnel)
+
+Activé par la variable d'environnement APP_PROFILE=1 : chaque réexécution du script
+mesure ses phases (chargement des modèles, normalisation, prédiction, construction des
+figures, injection du CSS/HTML), les affiche dans un panneau de la barre latérale et les
+ajoute au journal JSONL (APP_PROFILE_LOG, par défaut app_profile.jsonl).
+
+Le profileur actif est propre au fil d'exécution : Streamlit exécute chaque session dans
+son propre fil. Les temps sont exclusifs : une phase imbriquée (chargement paresseux d'un
+modèle pendant une prédiction) est décomptée de la phase qui la contient. Sans profileur
+actif, phase() ne mesure rien.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+PROFILE_ENV = 'APP_PROFILE'
+PROFILE_LOG_ENV = 'APP_PROFILE_LOG'
+PROFILE_LOG = 'app_profile.jsonl'
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+def enabled():
+    return os.environ.get(PROFILE_ENV, '').lower() in ('1', 'true', 'yes')
+
+
+def log_path():
+    return os.environ.get(PROFILE_LOG_ENV, PROFILE_LOG)
+
+
+class RerunProfiler:
+    """Temps cumulés par phase pendant une réexécution du script"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.calls = {}
+        self._stack = []
+
+    @contextmanager
+    def phase(self, name):
+        frame = [time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed - frame[1]
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self._stack:
+                self._stack[-1][1] += elapsed
+
+    def report(self, **info):
+        """Phases en millisecondes, le reste du script étant compté dans 'autre'"""
+        total = time.perf_counter() - self.started
+        phases = {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()}
+        phases['autre'] = round((total - sum(self.phases.values())) * 1000, 3)
+        return {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            **info,
+            'total_ms': round(total * 1000, 3),
+            'phases_ms': phases,
+            'calls': dict(self.calls)
+        }
+
+
+def start():
+    """Démarre le profilage de la réexécution courante ; renvoie None si le mode est désactivé"""
+    _local.profiler = RerunProfiler() if enabled() else None
+    return _local.profiler
+
+
+def current():
+    return getattr(_local, 'profiler', None)
+
+
+def phase(name):
+    """Mesure un bloc dans la réexécution courante (sans effet si le profilage est inactif)"""
+    profiler = getattr(_local, 'profiler', None)
+    return nullcontext() if profiler is None else profiler.phase(name)
+
+
+def finish(path=None, **info):
+    """Termine la réexécution courante : ajoute son rapport au journal et le renvoie"""
+    profiler = current()
+    if profiler is None:
+        return None
+    _local.profiler = None
+    report = profiler.report(**info)
+    path = path or log_path()
+    with _log_lock, open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(report, ensure_ascii=False) + '\n')
+    return report
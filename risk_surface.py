@@ -0,0 +1,121 @@
+"""
+Surface de scores BO2 précalculée pour l'exploration interactive (what-if)
+
+Les scores BO2 sont calculés une fois sur une grille régulière couvrant les plages des
+champs de saisie de la page "Score Continu", puis enregistrés en .npy (lu en mémoire
+mappée) avec un fichier JSON décrivant les axes et la version du modèle. La page lit
+ensuite les scores par interpolation multilinéaire, sans appeler le modèle.
+
+Usage (après train_models.py) :
+    python risk_surface.py
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import scoring
+
+SURFACE_FILE = 'bo2_surface.npy'
+SURFACE_META_FILE = 'bo2_surface.json'
+
+# Nombre de points par axe, sur les plages des champs de saisie (scoring.FEATURE_RANGES)
+SURFACE_POINTS = {'age': 42, 'sysBP': 18, 'totChol': 16, 'BMI': 15, 'glucose': 26}
+
+# Points de grille scorés par appel au modèle
+BUILD_CHUNK_SIZE = 200000
+
+
+class RiskSurface:
+    """Scores BO2 sur une grille régulière, interpolés linéairement entre les nœuds"""
+
+    def __init__(self, features, axes, grid, version=None):
+        self.features = list(features)
+        self.axes = [np.asarray(axis, dtype=np.float64) for axis in axes]
+        self.grid = grid
+        self.version = version
+
+    @classmethod
+    def load(cls, model_dir='.'):
+        """Ouvre la surface en mémoire mappée : seules les cellules lues sont chargées"""
+        with open(os.path.join(model_dir, SURFACE_META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+        grid = np.load(os.path.join(model_dir, SURFACE_FILE), mmap_mode='r')
+        return cls(meta['features'], meta['axes'], grid, meta.get('model_version'))
+
+    def bounds(self, feature):
+        axis = self.axes[self.features.index(feature)]
+        return float(axis[0]), float(axis[-1])
+
+    def interpolate(self, points):
+        """Scores interpolés pour des points (n, n_features), bornés aux plages de la grille"""
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        lower, weights = [], []
+        for d, axis in enumerate(self.axes):
+            x = np.clip(points[:, d], axis[0], axis[-1])
+            i = np.clip(np.searchsorted(axis, x, side='right') - 1, 0, len(axis) - 2)
+            lower.append(i)
+            weights.append((x - axis[i]) / (axis[i + 1] - axis[i]))
+
+        # Somme pondérée des 2^d sommets de la cellule contenant chaque point
+        scores = np.zeros(len(points))
+        for corner in np.ndindex(*(2,) * len(self.axes)):
+            index = tuple(i + c for i, c in zip(lower, corner))
+            weight = np.prod([w if c else 1 - w for w, c in zip(weights, corner)], axis=0)
+            scores += weight * self.grid[index]
+        return scores
+
+    def score(self, patient):
+        """Score interpolé d'un seul patient (dict feature -> valeur)"""
+        return float(self.interpolate([[patient[f] for f in self.features]])[0])
+
+    def curve(self, patient, feature, n_points=100):
+        """Score en faisant varier une seule feature sur toute sa plage, les autres fixées"""
+        low, high = self.bounds(feature)
+        values = np.linspace(low, high, n_points)
+        points = np.tile([patient[f] for f in self.features], (n_points, 1)).astype(np.float64)
+        points[:, self.features.index(feature)] = values
+        return values, self.interpolate(points)
+
+
+def build_surface(models, model_dir='.', points=SURFACE_POINTS, chunk_size=BUILD_CHUNK_SIZE):
+    """Score BO2 sur toute la grille et l'enregistre dans model_dir"""
+    features = models['BO2']['features']
+    grid_axes = [np.linspace(*scoring.FEATURE_RANGES[f], points[f]) for f in features]
+    shape = tuple(len(axis) for axis in grid_axes)
+
+    path = os.path.join(model_dir, SURFACE_FILE)
+    grid = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+    flat = grid.reshape(-1)
+    for start in range(0, flat.size, chunk_size):
+        index = np.unravel_index(np.arange(start, min(start + chunk_size, flat.size)), shape)
+        points = np.column_stack([axis[i] for axis, i in zip(grid_axes, index)])
+        flat[start:start + len(points)] = scoring.score_bo2(models, points)
+    grid.flush()
+    del grid, flat
+
+    meta = {
+        'features': list(features),
+        'axes': [axis.tolist() for axis in grid_axes],
+        'model_version': models['BO2']['version']
+    }
+    with open(os.path.join(model_dir, SURFACE_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return shape
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Précalcule la surface de scores BO2")
+    parser.add_argument('--model-dir', default='.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    shape = build_surface(scoring.load_models(args.model_dir), args.model_dir)
+    print(f"✅ Surface BO2 {' x '.join(map(str, shape))} ({np.prod(shape)} scores) "
+          f"écrite en {time.perf_counter() - start:.1f}s -> {SURFACE_FILE}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Mesure des étapes d'un entraînement : durée, temps CPU et mémoire maximale (RSS)
+
+Chaque processus a son propre enregistreur (STAGES) ; en entraînement parallèle, les
+processus de calcul renvoient leurs étapes au processus principal qui les fusionne
+dans le rapport.
+
+Les recherches d'hyperparamètres (n_jobs > 1) calculent dans les processus loky de
+joblib, que time.process_time() ne voit pas. À la fin de ces étapes (stage(...,
+workers=True)), l'exécuteur loky est arrêté : ses processus terminés sont alors comptés
+dans RUSAGE_CHILDREN, dont la variation est ajoutée au temps CPU de l'étape. Les autres
+étapes laissent le pool en place, son redémarrage faussant leurs mesures. Le module resource n'existant pas sous
+Windows, le temps CPU n'y couvre que le processus courant et la mémoire est absente.
+"""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from joblib.externals.loky import reusable_executor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPORT_FILE = 'training_report.json'
+
+
+def peak_rss_mb(who='self'):
+    """Mémoire résidente maximale atteinte depuis le démarrage, en Mo (None sans resource)"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss est en octets sous macOS, en kilo-octets ailleurs
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _children_cpu():
+    """Temps CPU des processus enfants terminés et attendus, en secondes"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _stop_worker_pool():
+    """Arrête les processus loky réutilisables de joblib pour que leur usage soit compté"""
+    executor = reusable_executor._executor
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+class StageRecorder:
+    """Liste des étapes mesurées dans le processus courant"""
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, objective=None, workers=False):
+        """Mesure un bloc ; workers=True pour une étape qui calcule dans les processus loky"""
+        wall, cpu, children = time.perf_counter(), time.process_time(), _children_cpu()
+        try:
+            yield
+        finally:
+            if workers:
+                _stop_worker_pool()
+            own_cpu = time.process_time() - cpu
+            children_cpu = _children_cpu() - children
+            self.stages.append({
+                'stage': name,
+                'objective': objective,
+                'pid': os.getpid(),
+                'wall_s': round(time.perf_counter() - wall, 4),
+                # Processus courant et processus de calcul de joblib (arbre de processus)
+                'cpu_s': round(own_cpu + children_cpu, 4),
+                'children_cpu_s': round(children_cpu, 4),
+                'peak_rss_mb': peak_rss_mb(),
+                # Maximum sur tous les processus enfants terminés jusqu'ici
+                'children_peak_rss_mb': peak_rss_mb('children')
+            })
+
+    def take(self):
+        """Renvoie les étapes enregistrées et vide la liste"""
+        stages, self.stages = self.stages, []
+        return stages
+
+
+STAGES = StageRecorder()
+stage = STAGES.stage
+
+
+def write_report(stages, started, path=REPORT_FILE, **info):
+    """Écrit le rapport JSON de l'entraînement ; started vient de time.perf_counter()"""
+    _stop_worker_pool()
+    usage_cpu = time.process_time()
+    children_cpu = None if resource is None else _children_cpu()
+    report = {
+        'finished_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'total_wall_s': round(time.perf_counter() - started, 4),
+        'total_cpu_s': round(usage_cpu, 4),
+        'children_cpu_s': None if children_cpu is None else round(children_cpu, 4),
+        'peak_rss_mb': peak_rss_mb(),
+        'children_peak_rss_mb': peak_rss_mb('children'),
+        **info,
+        'stages': stages
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+
+def summary(stages, top=5):
+    """Lignes lisibles des étapes les plus longues"""
+    longest = sorted(stages, key=lambda s: s['wall_s'], reverse=True)[:top]
+    return [f"{s['objective'] + ' ' if s['objective'] else ''}{s['stage']} : {s['wall_s']:.2f}s "
+            f"(CPU {s['cpu_s']:.2f}s)" for s in longest]
@@ -0,0 +1,88 @@
+"""
+Scoring en masse d'un fichier CSV de patients, lu et écrit par blocs
+
+La mémoire utilisée dépend de la taille des blocs et non de celle du fichier. Le fichier
+de sortie n'apparaît qu'une fois tous les blocs scorés (fichier temporaire puis renommage).
+
+Usage :
+    python score_csv.py patients.csv resultats.csv --chunk-size 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+import scoring
+
+
+def score_csv(input_path, output_path, models, medians, chunk_size=scoring.BATCH_CHUNK_SIZE):
+    """Lit input_path par blocs, score BO1 à BO4 et ajoute chaque bloc à output_path
+
+    Les valeurs manquantes sont imputées par score_batch avec medians ; les valeurs non
+    numériques sont traitées comme manquantes et leurs lignes signalées sur stderr. Le
+    fichier de sortie garde les valeurs d'entrée telles quelles.
+    """
+    required = scoring.required_features(models)
+    n_rows = 0
+    n_invalid = 0
+    tmp_path = f"{output_path}.tmp"
+    try:
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as out:
+            reader = pd.read_csv(input_path, na_values=scoring.NA_VALUES, chunksize=chunk_size)
+            for i, chunk in enumerate(reader):
+                missing_cols = [col for col in required if col not in chunk.columns]
+                if missing_cols:
+                    raise ValueError(f"Colonnes manquantes dans le fichier : {', '.join(missing_cols)}")
+
+                numeric, invalid_rows = scoring.coerce_numeric(chunk, required)
+                if len(invalid_rows):
+                    # Numéros de ligne du fichier (ligne 1 : en-tête), l'index continuant d'un bloc à l'autre
+                    lines = ', '.join(str(row + 2) for row in invalid_rows)
+                    print(f"Bloc {i + 1} : valeurs non numériques traitées comme manquantes (lignes {lines})",
+                          file=sys.stderr)
+                    n_invalid += len(invalid_rows)
+
+                scores = scoring.score_batch(models, numeric, chunk_size=len(chunk), medians=medians)
+                chunk.join(scores).to_csv(out, header=(i == 0), index=False)
+
+                n_rows += len(chunk)
+                print(f"Bloc {i + 1} : {n_rows} patients scorés")
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if n_invalid:
+        print(f"⚠️ {n_invalid} patient(s) avec des valeurs non numériques", file=sys.stderr)
+    return n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scoring BO1 à BO4 d'un fichier CSV de patients")
+    parser.add_argument('input', help="CSV au format de heart_disease.csv")
+    parser.add_argument('output', help="CSV de sortie (colonnes d'entrée + résultats)")
+    parser.add_argument('--chunk-size', type=int, default=scoring.BATCH_CHUNK_SIZE,
+                        help="nombre de lignes lues et scorées à la fois")
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--training-data', default=scoring.TRAINING_DATA,
+                        help="jeu d'entraînement dont les médianes servent à l'imputation, "
+                             "si elles n'ont pas été enregistrées avec les modèles")
+    args = parser.parse_args()
+
+    models = scoring.load_models(args.model_dir)
+    medians = models.medians
+    if medians is None:
+        medians = scoring.training_medians(args.training_data)
+
+    start = time.perf_counter()
+    try:
+        n_rows = score_csv(args.input, args.output, models, medians, args.chunk_size)
+    except ValueError as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"\n✅ {n_rows} patients scorés en {time.perf_counter() - start:.1f}s -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,413 @@
+"""
+Moteur de scoring indépendant de Streamlit pour les objectifs métier BO1 à BO4
+Utilisable depuis l'application, un script en ligne de commande ou un service
+"""
+import hashlib
+import json
+import os
+import threading
+from collections.abc import Mapping
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import model_bundle
+from compiled_models import CompiledForest, FusedKMeans, NativeBooster, fuse_scaler
+from profiling import phase
+
+OBJECTIVES = ['BO1', 'BO2', 'BO3', 'BO4']
+
+# Modèles compilés (compiled_models.py) utilisés à la place du pickle s'ils existent
+COMPILED_MODEL_FILES = {'BO1': 'model_BO1.ubj', 'BO2': 'model_BO2.ubj', 'BO3': 'model_BO3_compiled.npz'}
+
+# Lecture des CSV patients, identique à train_models.py
+TRAINING_DATA = 'heart_disease.csv'
+NA_VALUES = ['NA', 'nan', 'NaN', '']
+# Médianes d'imputation calculées par train_models.py
+MEDIANS_FILE = 'imputation_medians.json'
+
+# Taille des blocs pour le scoring par lot
+BATCH_CHUNK_SIZE = 10000
+RISK_LEVELS = {0: "FAIBLE", 1: "MOYEN", 2: "ÉLEVÉ"}
+# Plages des features continues, identiques aux champs de saisie de l'application
+FEATURE_RANGES = {
+    'age': (18, 100),
+    'sysBP': (80, 250),
+    'diaBP': (40, 150),
+    'totChol': (100, 400),
+    'BMI': (15, 50),
+    'heartRate': (40, 120),
+    'glucose': (50, 300)
+}
+SENSITIVITY_POINTS = 50
+
+RESULT_COLUMNS = ['BO1_haut_risque', 'BO1_probabilite', 'BO2_score',
+                  'BO3_niveau', 'BO3_confiance', 'BO4_cluster', 'BO4_marge']
+
+
+class LazyModels(Mapping):
+    """Objectifs dont les artefacts sont chargés au premier accès puis gardés en mémoire
+
+    S'utilise comme le dictionnaire {'BO1': {...}, ...} renvoyé auparavant : une session
+    qui ne visite que la page Clustering ne charge que BO4. medians contient les médianes
+    d'imputation de l'entraînement, ou None si elles n'ont pas été enregistrées.
+
+    reopen renvoie (loader, names, medians) pour la version courante des modèles : si les
+    fichiers d'un objectif ont disparu ou si le bundle a été remplacé (réentraînement
+    entre-temps), les objectifs déjà chargés sont oubliés et tout est rechargé depuis la
+    nouvelle version.
+    """
+
+    def __init__(self, loader, names=OBJECTIVES, medians=None, reopen=None):
+        self.medians = medians
+        self._loader = loader
+        self._names = list(names)
+        self._reopen = reopen
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        if name not in self._names:
+            raise KeyError(name)
+        entry = self._cache.get(name)
+        if entry is None:
+            with self._lock:
+                entry = self._cache.get(name)
+                if entry is None:
+                    with phase('chargement des modèles'):
+                        entry = self._cache[name] = self._load(name)
+        return entry
+
+    def _load(self, name):
+        try:
+            return self._loader(name)
+        except (FileNotFoundError, model_bundle.BundleError):
+            if self._reopen is None:
+                raise
+        # Version supprimée depuis l'ouverture : pas de mélange entre ancienne et nouvelle version
+        self._loader, names, self.medians = self._reopen()
+        self._names = list(names)
+        self._cache.clear()
+        if name not in self._names:
+            raise KeyError(name)
+        return self._loader(name)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def loaded(self):
+        """Objectifs déjà chargés"""
+        return [name for name in self._names if name in self._cache]
+
+
+def load_models(model_dir='.'):
+    """Prépare le chargement paresseux des modèles, objectif par objectif
+
+    Les fichiers partagés en mémoire mappée sont utilisés s'ils existent et correspondent à
+    la version du bundle, sinon le bundle versionné, sinon les fichiers séparés. La présence des
+    fichiers (ou le manifeste du bundle) est vérifiée immédiatement : FileNotFoundError
+    ou BundleError sont levées ici plutôt qu'au premier accès.
+    """
+    loader, names, medians = _open_models(model_dir)
+    return LazyModels(loader, names, medians, reopen=lambda: _open_models(model_dir))
+
+
+def _open_models(model_dir):
+    """(loader, objectifs, médianes) de la version des modèles présente sur le disque"""
+    # Seul le petit manifeste JSON est lu ici ; les objectifs sont projetés au premier accès
+    shared_dir = os.path.join(model_dir, model_bundle.SHARED_DIR)
+    shared = None
+    if os.path.exists(os.path.join(shared_dir, model_bundle.SHARED_MANIFEST)):
+        shared = model_bundle.read_shared_manifest(shared_dir)
+    bundle_path = os.path.join(model_dir, model_bundle.BUNDLE_FILE)
+    if os.path.exists(bundle_path):
+        reader = model_bundle.BundleReader(bundle_path)
+        if shared is None or shared['model_version'] != reader.manifest['model_version']:
+            return (reader.load, reader.manifest['objectives'],
+                    _medians_series(reader.manifest.get('imputation_medians')))
+    if shared is not None:
+        return (lambda name: model_bundle.load_shared(shared, name, shared_dir), shared['objectives'],
+                _medians_series(shared['imputation_medians']))
+
+    for name in OBJECTIVES:
+        for filename in _legacy_files(name):
+            if not os.path.exists(os.path.join(model_dir, filename)):
+                raise FileNotFoundError(filename)
+    medians_path = os.path.join(model_dir, MEDIANS_FILE)
+    medians = load_medians(medians_path) if os.path.exists(medians_path) else None
+    return lambda name: _load_legacy_objective(model_dir, name), OBJECTIVES, medians
+
+
+def _medians_series(medians):
+    return None if medians is None else pd.Series(medians, dtype=np.float64)
+
+
+def _legacy_files(name):
+    files = [f'model_{name}.pkl', f'scaler_{name}.pkl', f'features_{name}.pkl']
+    if name == 'BO3':
+        files.append('top_5_features_BO3.pkl')
+    if name == 'BO4':
+        files.append('cluster_info_BO4.csv')
+    return files
+
+
+def _load_legacy_objective(model_dir, name):
+    """Charge un objectif depuis les fichiers séparés model_*.pkl, scaler_*.pkl, etc."""
+    def path(filename):
+        return os.path.join(model_dir, filename)
+
+    model_path = path(f'model_{name}.pkl')
+    loaded = [model_path, path(f'scaler_{name}.pkl'), path(f'features_{name}.pkl')]
+    # Export compilé, plus rapide à charger et à évaluer, s'il existe : forêt en tableaux
+    # NumPy (.npz) ou booster XGBoost au format natif (.ubj)
+    compiled_path = path(COMPILED_MODEL_FILES.get(name, ''))
+    if name in COMPILED_MODEL_FILES and os.path.exists(compiled_path):
+        if compiled_path.endswith('.npz'):
+            # Pickle d'origine chargé seulement au premier lot trop gros pour la forêt compilée
+            model = CompiledForest.load(compiled_path, estimator=os.path.abspath(model_path))
+        else:
+            model = NativeBooster.load(compiled_path)
+        loaded.append(compiled_path)
+    else:
+        model = joblib.load(model_path)
+    entry = {
+        'model': model,
+        'scaler': joblib.load(path(f'scaler_{name}.pkl')),
+        'features': joblib.load(path(f'features_{name}.pkl'))
+    }
+    if name == 'BO3':
+        entry['top_features'] = joblib.load(path('top_5_features_BO3.pkl'))
+        loaded.append(path('top_5_features_BO3.pkl'))
+    if name == 'BO4':
+        entry['cluster_info'] = pd.read_csv(path('cluster_info_BO4.csv'))
+        loaded.append(path('cluster_info_BO4.csv'))
+    # Sans bundle, la version est l'empreinte du contenu des fichiers utilisés, comme pour le bundle
+    entry['version'] = _files_version(loaded)
+    return entry
+
+
+def _files_version(paths):
+    digest = hashlib.sha256()
+    for file_path in paths:
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def load_legacy_models(model_dir='.'):
+    """Charge immédiatement tous les objectifs depuis les fichiers séparés"""
+    return {name: _load_legacy_objective(model_dir, name) for name in OBJECTIVES}
+
+
+def required_features(models):
+    """Liste ordonnée et sans doublon des features utilisées par au moins un objectif"""
+    return list(dict.fromkeys(
+        feature for name in OBJECTIVES for feature in models[name]['features']
+    ))
+
+
+def coerce_numeric(data, columns):
+    """Copie de data où les valeurs non numériques de columns (ex. sysBP='abc') deviennent manquantes
+
+    Renvoie aussi l'index des lignes qui contenaient au moins une telle valeur, à signaler.
+    """
+    numeric = data[columns].apply(pd.to_numeric, errors='coerce')
+    invalid_rows = data.index[(numeric.isna() & data[columns].notna()).any(axis=1)]
+    data = data.copy()
+    data[columns] = numeric
+    return data, invalid_rows
+
+
+def fit_medians(data):
+    """Médianes de toutes les colonnes numériques, calculées en une seule passe"""
+    return data.select_dtypes(include=[np.number]).median()
+
+
+def training_medians(csv_path=TRAINING_DATA):
+    """Médianes des colonnes numériques du jeu d'entraînement (imputation de train_models.py)"""
+    return fit_medians(pd.read_csv(csv_path, na_values=NA_VALUES))
+
+
+def save_medians(medians, path=MEDIANS_FILE):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({column: float(value) for column, value in medians.items()}, f, indent=2)
+
+
+def load_medians(path=MEDIANS_FILE):
+    with open(path, encoding='utf-8') as f:
+        return pd.Series(json.load(f), dtype=np.float64)
+
+
+def impute(data, medians):
+    """Remplace les valeurs manquantes par les médianes d'entraînement, colonne par colonne"""
+    return data.fillna(medians)
+
+
+def _select(models, name, X):
+    """Met les données au format de l'objectif : DataFrame des features, dans l'ordre
+
+    X peut être un DataFrame (colonnes sélectionnées par nom), un dict pour un seul
+    patient, ou un tableau dont les colonnes suivent l'ordre des features.
+    """
+    features = models[name]['features']
+    if isinstance(X, dict):
+        X = pd.DataFrame([X])
+    if isinstance(X, pd.DataFrame):
+        return X[features]
+    return pd.DataFrame(np.atleast_2d(np.asarray(X, dtype=float)), columns=features)
+
+
+def _prepare(models, name, X):
+    """Sélectionne les features puis les normalise
+
+    Un modèle fusionné avec son scaler (scaler None) reçoit directement les valeurs brutes.
+    """
+    X = _select(models, name, X)
+    scaler = models[name]['scaler']
+    with phase('normalisation'):
+        if scaler is None:
+            return X.to_numpy(dtype=np.float64)
+        return scaler.transform(X)
+
+
+def score_bo1(models, X):
+    """BO1 : renvoie (classe haut risque prédite, probabilités des deux classes)"""
+    X = _prepare(models, 'BO1', X)
+    with phase('prédiction'):
+        proba = models['BO1']['model'].predict_proba(X)
+    return proba.argmax(axis=1), proba
+
+
+def score_bo2(models, X):
+    """BO2 : renvoie le score de risque continu borné entre 0 et 100"""
+    X = _prepare(models, 'BO2', X)
+    with phase('prédiction'):
+        return np.clip(models['BO2']['model'].predict(X), 0, 100)
+
+
+def score_bo3(models, X):
+    """BO3 : renvoie (niveau de risque 0/1/2, probabilités par niveau)"""
+    model = models['BO3']['model']
+    X = _prepare(models, 'BO3', X)
+    with phase('prédiction'):
+        proba = model.predict_proba(X)
+    return model.classes_.take(proba.argmax(axis=1)), proba
+
+
+def score_bo4(models, X):
+    """BO4 : renvoie l'indice du cluster (à partir de 0)"""
+    assigner = bo4_assigner(models)
+    X = _select(models, 'BO4', X).to_numpy(dtype=np.float64)
+    with phase('prédiction'):
+        return assigner.predict(X)
+
+
+def bo4_assigner(models):
+    """Affectation BO4 sur valeurs brutes, normalisation intégrée aux centres (créée une fois par entrée)"""
+    entry = models['BO4']
+    if 'assigner' not in entry:
+        model = entry['model']
+        entry['assigner'] = model if isinstance(model, FusedKMeans) else fuse_scaler(model, entry['scaler'])
+    return entry['assigner']
+
+
+def assign_bo4(models, X):
+    """BO4 en masse : renvoie (cluster à partir de 0, distances à chaque centre, marge de confiance)
+
+    La marge est l'écart de distance entre le centre le plus proche et le suivant :
+    proche de 0, le patient est à la frontière de deux clusters.
+    """
+    return bo4_assigner(models).assign(_select(models, 'BO4', X).to_numpy(dtype=np.float64))
+
+
+SCORERS = {'BO1': score_bo1, 'BO2': score_bo2, 'BO3': score_bo3, 'BO4': score_bo4}
+
+
+def score_cached(cache, models, name, X):
+    """Score un seul patient via un PredictionCache (prediction_cache.py)
+
+    Même résultat que SCORERS[name](models, X) ; la clé inclut la version du modèle.
+    """
+    features = models[name]['features']
+    values = cache.normalize(_select(models, name, X).iloc[0])
+    key = (name, models[name]['version'], values)
+    return cache.get_or_compute(
+        key, lambda: SCORERS[name](models, pd.DataFrame([values], columns=features))
+    )
+
+
+def sensitivity(models, name, patient, factors, n_points=SENSITIVITY_POINTS):
+    """Balayage what-if : fait varier chaque facteur sur sa plage, les autres features fixées
+
+    Toute la matrice de balayage (len(factors) x n_points patients) est scorée en un seul
+    appel au modèle. Renvoie un DataFrame long : facteur, valeur, puis la sortie de
+    l'objectif (probabilité BO1, score BO2 ou probabilité de chaque niveau BO3).
+    """
+    features = list(models[name]['features'])
+    unknown = [f for f in factors if f not in features or f not in FEATURE_RANGES]
+    if unknown:
+        raise ValueError(f"Facteurs non balayables pour {name} : {', '.join(unknown)}")
+
+    base = _select(models, name, patient).iloc[0].to_numpy(dtype=np.float64)
+    values = np.concatenate([np.linspace(*FEATURE_RANGES[f], n_points) for f in factors])
+    factor_index = np.repeat(np.arange(len(factors)), n_points)
+    # Chaque bloc de n_points lignes ne modifie qu'une colonne du patient de départ
+    sweep = np.tile(base, (len(values), 1))
+    columns = np.array([features.index(f) for f in factors])[factor_index]
+    sweep[np.arange(len(values)), columns] = values
+
+    out = pd.DataFrame({'facteur': np.asarray(factors)[factor_index], 'valeur': values})
+    if name == 'BO1':
+        out['probabilite'] = score_bo1(models, sweep)[1][:, 1]
+    elif name == 'BO2':
+        out['score'] = score_bo2(models, sweep)
+    elif name == 'BO3':
+        proba = score_bo3(models, sweep)[1]
+        for j, level in enumerate(models['BO3']['model'].classes_):
+            out[RISK_LEVELS[level]] = proba[:, j]
+    else:
+        raise ValueError(f"Balayage non supporté pour {name}")
+    return out
+
+
+def score_batch(models, data, chunk_size=BATCH_CHUNK_SIZE, medians=None):
+    """Score un lot de patients pour BO1 à BO4 (un appel vectorisé par modèle et par bloc)
+
+    Les valeurs manquantes sont d'abord remplacées, bloc par bloc, par les médianes
+    d'entraînement (medians, sinon celles enregistrées avec les modèles) : les patients
+    incomplets sont scorés avec les autres.
+    """
+    if medians is None:
+        medians = getattr(models, 'medians', None)
+    required = required_features(models)
+    results = []
+    for start in range(0, len(data), chunk_size):
+        chunk = data.iloc[start:start + chunk_size][required]
+        if medians is not None:
+            chunk = impute(chunk, medians)
+        out = pd.DataFrame(index=chunk.index)
+
+        prediction, proba = score_bo1(models, chunk)
+        out['BO1_haut_risque'] = prediction
+        out['BO1_probabilite'] = proba[:, 1]
+
+        out['BO2_score'] = score_bo2(models, chunk)
+
+        level, proba = score_bo3(models, chunk)
+        out['BO3_niveau'] = pd.Series(level, index=chunk.index).map(RISK_LEVELS)
+        out['BO3_confiance'] = proba.max(axis=1)
+
+        # Cluster affiché à partir de 1 comme dans l'interface
+        cluster, _, margin = assign_bo4(models, chunk)
+        out['BO4_cluster'] = cluster + 1
+        out['BO4_marge'] = margin
+
+        results.append(out)
+    if not results:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return pd.concat(results)
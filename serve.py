@@ -0,0 +1,191 @@
+"""
+Serveur HTTP local de scoring BO1 à BO4 avec regroupement des requêtes (micro-batching)
+
+Usage :
+    python serve.py --port 8000 --max-batch-size 32 --max-wait-ms 5
+
+Exemple :
+    curl -X POST http://localhost:8000/bo2 \\
+         -d '{"age": 50, "sysBP": 120, "totChol": 200, "BMI": 25, "glucose": 85}'
+"""
+import argparse
+import json
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+import scoring
+
+
+class MicroBatcher:
+    """Regroupe les requêtes concurrentes d'un objectif en petits lots avant le scoring
+
+    Un lot part dès qu'il atteint max_batch_size patients ou que le premier patient
+    en attente a patienté max_wait_ms millisecondes.
+    """
+
+    def __init__(self, score_fn, max_batch_size=32, max_wait_ms=5.0):
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, patient):
+        """Ajoute un patient à la file et renvoie un Future portant son résultat"""
+        future = Future()
+        self._queue.put((patient, future))
+        return future
+
+    def _collect(self):
+        """Attend un premier patient puis complète le lot jusqu'à la taille ou au délai maximal"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.score_fn(pd.DataFrame([patient for patient, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+def _bo1(models, patients):
+    prediction, proba = scoring.score_bo1(models, patients)
+    return [{'haut_risque': int(p), 'probabilite': float(pr[1])} for p, pr in zip(prediction, proba)]
+
+
+def _bo2(models, patients):
+    return [{'score': float(s)} for s in scoring.score_bo2(models, patients)]
+
+
+def _bo3(models, patients):
+    level, proba = scoring.score_bo3(models, patients)
+    return [{'niveau': int(l), 'libelle': scoring.RISK_LEVELS[int(l)], 'probabilites': pr.tolist()}
+            for l, pr in zip(level, proba)]
+
+
+def _bo4(models, patients):
+    # Cluster affiché à partir de 1 comme dans l'interface
+    cluster, _, margin = scoring.assign_bo4(models, patients)
+    return [{'cluster': int(c) + 1, 'marge': float(m)} for c, m in zip(cluster, margin)]
+
+
+SCORERS = {'BO1': _bo1, 'BO2': _bo2, 'BO3': _bo3, 'BO4': _bo4}
+
+
+def validate_patient(patient, features):
+    """Vérifie qu'un patient fournit une valeur numérique finie pour chaque feature"""
+    if not isinstance(patient, dict):
+        raise ValueError("chaque patient doit être un objet JSON")
+    missing = [f for f in features if f not in patient]
+    if missing:
+        raise ValueError(f"features manquantes : {', '.join(missing)}")
+    row = {}
+    for f in features:
+        value = patient[f]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"valeur non numérique pour {f}")
+        row[f] = float(value)
+    return row
+
+
+class ScoringServer(ThreadingHTTPServer):
+    # File d'attente d'écoute suffisante pour des rafales de requêtes concurrentes
+    request_queue_size = 128
+
+
+def make_handler(models, batchers):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok'})
+            else:
+                self._send_json(404, {'erreur': 'route inconnue'})
+
+        def do_POST(self):
+            name = self.path.strip('/').upper()
+            if name not in batchers:
+                self._send_json(404, {'erreur': 'route inconnue'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'null')
+                patients = payload if isinstance(payload, list) else [payload]
+                rows = [validate_patient(p, models[name]['features']) for p in patients]
+            except ValueError as e:
+                self._send_json(400, {'erreur': str(e)})
+                return
+
+            futures = [batchers[name].submit(row) for row in rows]
+            try:
+                results = [future.result() for future in futures]
+            except Exception as e:
+                self._send_json(500, {'erreur': str(e)})
+                return
+            self._send_json(200, results if isinstance(payload, list) else results[0])
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur HTTP de scoring BO1 à BO4")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=32,
+                        help="nombre maximal de patients regroupés dans un appel au modèle")
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help="délai maximal d'attente pour compléter un lot (millisecondes)")
+    parser.add_argument('--model-dir', default='.')
+    args = parser.parse_args()
+
+    models = scoring.load_models(args.model_dir)
+    # Chargement de tous les objectifs au démarrage plutôt qu'à la première requête
+    for name in SCORERS:
+        models[name]
+    batchers = {
+        name: MicroBatcher(lambda patients, fn=fn: fn(models, patients),
+                           args.max_batch_size, args.max_wait_ms)
+        for name, fn in SCORERS.items()
+    }
+    server = ScoringServer((args.host, args.port), make_handler(models, batchers))
+    print(f"Serveur de scoring démarré sur http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,215 +1,713 @@
 """
 Script pour entraîner et sauvegarder les modèles pour chaque objectif métier
+
+Usage :
+    python train_models.py                          # objectifs entraînés l'un après l'autre
+    python train_models.py --parallel --n-jobs 8    # objectifs entraînés en parallèle
+    python train_models.py --search halving         # recherche par élimination successive
+    python train_models.py --fused                  # bundle avec scalers intégrés aux modèles
+    python train_models.py --incremental nouveaux.csv   # mise à jour avec de nouveaux patients
+    python train_models.py --out-of-core registre.csv   # entraînement par blocs lus sur disque
 """
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold
+from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold, ParameterGrid
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingGridSearchCV
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.linear_model import LogisticRegression, LinearRegression
 from sklearn.tree import DecisionTreeClassifier
 from xgboost import XGBClassifier, XGBRegressor
-from sklearn.cluster import KMeans
-from sklearn.metrics import accuracy_score, f1_score, roc_auc_score, mean_squared_error, r2_score
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import accuracy_score, f1_score, roc_auc_score, mean_squared_error, r2_score, get_scorer
+from sklearn.base import clone
+from threadpoolctl import threadpool_limits
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import copy
 import joblib
+import json
 import os
+import tempfile
+import time
+import sklearn
+import xgboost
+
+import dataset
+import model_bundle
+import run_report
+import scoring
+from compiled_models import CompiledForest, NativeBooster, fuse_scaler, rescale_xgboost
+from run_report import STAGES, stage
+
+features_BO1 = ['age', 'sysBP', 'diaBP', 'totChol', 'BMI', 'heartRate', 'glucose',
+                'currentSmoker', 'prevalentHyp', 'diabetes']
+features_BO2 = ['age', 'sysBP', 'totChol', 'BMI', 'glucose']
+features_BO3 = ['age', 'sysBP', 'diaBP', 'totChol', 'BMI', 'heartRate', 'glucose',
+                'currentSmoker', 'prevalentHyp', 'diabetes']
+features_BO4 = ['age', 'sysBP', 'totChol', 'BMI', 'currentSmoker', 'glucose']
 
-# Chargement des données
-print("Chargement des données...")
-data = pd.read_csv('heart_disease.csv', na_values=['NA', 'nan', 'NaN', ''])
-
-# Nettoyage des données
-print("Nettoyage des données...")
 
-# Imputation des valeurs manquantes
-from sklearn.impute import SimpleImputer
-imputer = SimpleImputer(strategy='median')
-numeric_cols = ['cigsPerDay', 'BPMeds', 'totChol', 'BMI', 'heartRate', 'glucose', 'age', 'sysBP', 'diaBP']
-for col in numeric_cols:
-    if col in data.columns:
-        data[col] = imputer.fit_transform(data[[col]]).ravel()
+def load_data(path=scoring.TRAINING_DATA, use_cache=True):
+    """Charge et nettoie le jeu de données, renvoie (données, médianes d'imputation)"""
+    # Chargement des données (cache colonnaire typé, reconstruit si le CSV a changé)
+    print("Chargement des données...")
+    with stage('chargement CSV'):
+        data = dataset.load_dataset(path, use_cache=use_cache)
+
+    # Nettoyage des données : médianes de toutes les colonnes numériques en une passe,
+    # appliquées en une seule opération et réutilisées telles quelles à l'inférence
+    print("Nettoyage des données...")
+    with stage('imputation'):
+        medians = scoring.fit_medians(data)
+        data = scoring.impute(data, medians)
+    return data, medians
+
+
+def build_targets(data, score_range=None):
+    """Crée les variables cibles partagées par les objectifs (high_risk, cardiac_risk_score)
+
+    score_range (min, max) fixe la normalisation du score ; par défaut, celle des données.
+    """
+    # Création de la variable cible : haut risque basé sur Heart_ stroke
+    data['high_risk'] = (data['Heart_ stroke'].str.lower().str.strip() == 'yes').astype(int)
+
+    # Création du score de risque continu (colonnes déjà imputées par load_data)
+    data['cardiac_risk_score'] = raw_risk_score(data)
+    # Normalisation entre 0 et 100
+    score_min, score_max = score_range or (data['cardiac_risk_score'].min(), data['cardiac_risk_score'].max())
+    if score_max > score_min:
+        data['cardiac_risk_score'] = ((data['cardiac_risk_score'] - score_min) /
+                                      (score_max - score_min) * 100)
+    else:
+        data['cardiac_risk_score'] = 50  # Valeur par défaut si toutes les valeurs sont identiques
+
+    # S'assurer qu'il n'y a pas de NaN
+    data['cardiac_risk_score'] = data['cardiac_risk_score'].fillna(50)
+    return data
+
+
+def raw_risk_score(data):
+    """Score de risque brut, avant normalisation entre 0 et 100"""
+    return (
+        data['age'] * 0.1 +
+        data['sysBP'] * 0.3 +
+        data['totChol'] * 0.2 +
+        data['BMI'] * 0.2 +
+        data['glucose'] * 0.2 +
+        data['currentSmoker'] * 10 +
+        data['prevalentHyp'] * 15 +
+        data['diabetes'] * 20
+    )
+
+
+def raw_score_range(data):
+    """(min, max) du score de risque brut, qui fixe la normalisation du score"""
+    raw = raw_risk_score(data)
+    return float(raw.min()), float(raw.max())
+
+
+SEARCH_STRATEGIES = ['grid', 'halving', 'early-stopping']
+
+
+def _fit_search(estimator, param_grid, scoring, X, y, n_jobs, search='grid'):
+    """Sélection des hyperparamètres selon la stratégie choisie
+
+    - grid : GridSearchCV exhaustif
+    - halving : HalvingGridSearchCV, les candidats sont éliminés par tours successifs
+    - early-stopping : pour XGBoost, n_estimators est fixé par arrêt précoce sur un
+      fold de validation au lieu d'être cherché dans la grille (halving sinon)
+
+    La recherche est parallélisée sur les candidats uniquement, pour ne pas imbriquer
+    les pools ; le meilleur modèle retrouve n_jobs=-1 avant la sauvegarde pour l'inférence.
+    """
+    estimator.set_params(n_jobs=1)
+    if search == 'early-stopping' and isinstance(estimator, (XGBClassifier, XGBRegressor)):
+        model = _fit_early_stopping(estimator, param_grid, scoring, X, y, n_jobs)
+    else:
+        if search == 'grid':
+            grid = GridSearchCV(estimator, param_grid, cv=3, scoring=scoring, n_jobs=n_jobs, verbose=0)
+        else:
+            grid = HalvingGridSearchCV(estimator, param_grid, cv=3, scoring=scoring, factor=3,
+                                       random_state=42, n_jobs=n_jobs, verbose=0)
+        grid.fit(X, y)
+        model = grid.best_estimator_
+    return model.set_params(n_jobs=-1)
+
+
+def _fit_early_stopping(estimator, param_grid, scoring, X, y, n_jobs, rounds=20):
+    """Recherche XGBoost avec arrêt précoce : n_estimators devient un plafond
+
+    Chaque combinaison des autres paramètres est entraînée une seule fois sur 80 % des
+    données, arrêtée quand le fold de validation ne progresse plus, puis le meilleur
+    candidat est réentraîné sur toutes les données avec le nombre d'arbres retenu.
+    """
+    max_estimators = max(param_grid.get('n_estimators', [estimator.get_params()['n_estimators'] or 100]))
+    other_params = {k: v for k, v in param_grid.items() if k != 'n_estimators'}
+    stratify = y if isinstance(estimator, XGBClassifier) else None
+    X_fit, X_val, y_fit, y_val = train_test_split(X, y, test_size=0.2, random_state=42, stratify=stratify)
+    scorer = get_scorer(scoring)
+
+    best = None
+    for params in ParameterGrid(other_params):
+        candidate = clone(estimator).set_params(n_estimators=max_estimators, early_stopping_rounds=rounds,
+                                                n_jobs=n_jobs, **params)
+        candidate.fit(X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False)
+        score = scorer(candidate, X_val, y_val)
+        if best is None or score > best[0]:
+            best = (score, params, candidate.best_iteration + 1)
+
+    _, params, n_estimators = best
+    model = clone(estimator).set_params(n_estimators=n_estimators, n_jobs=n_jobs, **params)
+    return model.fit(X, y)
+
+
+def save_xgboost(model, name, X_check=None):
+    """Enregistre un modèle XGBoost en pickle et son booster au format natif (model_<name>.ubj)
+
+    Avec X_check, vérifie que le booster natif reproduit les prédictions du modèle.
+    """
+    joblib.dump(model, f'model_{name}.pkl')
+    native = NativeBooster.from_xgboost(model)
+    if X_check is not None:
+        expected = model.predict_proba(X_check) if native.is_classifier else model.predict(X_check)
+        obtained = native.predict_proba(X_check) if native.is_classifier else native.predict(X_check)
+        if not np.array_equal(obtained, expected):
+            raise RuntimeError(f"Le booster natif {name} ne reproduit pas les prédictions du modèle")
+    native.save(f'model_{name}.ubj')
 
-# Remplacer les valeurs manquantes pour les colonnes numériques
-numeric_cols_all = data.select_dtypes(include=[np.number]).columns
-for col in numeric_cols_all:
-    if data[col].isna().any():
-        data[col].fillna(data[col].median(), inplace=True)
 
 # ========== BO1 : Classification binaire (Haut risque) ==========
-print("\n=== BO1 : Classification binaire ===")
-features_BO1 = ['age', 'sysBP', 'diaBP', 'totChol', 'BMI', 'heartRate', 'glucose', 
-                'currentSmoker', 'prevalentHyp', 'diabetes']
-X_BO1 = data[features_BO1].fillna(data[features_BO1].median())
-
-# Création de la variable cible : haut risque basé sur Heart_ stroke
-data['high_risk'] = (data['Heart_ stroke'].str.lower().str.strip() == 'yes').astype(int)
-y_BO1 = data['high_risk']
-
-X_train_BO1, X_test_BO1, y_train_BO1, y_test_BO1 = train_test_split(
-    X_BO1, y_BO1, test_size=0.3, random_state=42, stratify=y_BO1
-)
-
-scaler_BO1 = StandardScaler()
-X_train_BO1_scaled = scaler_BO1.fit_transform(X_train_BO1)
-X_test_BO1_scaled = scaler_BO1.transform(X_test_BO1)
-
-# Entraînement XGBoost pour BO1
-print("Entraînement XGBoost pour BO1...")
-xgb_BO1 = XGBClassifier(random_state=42, n_jobs=-1, eval_metric='logloss')
-param_grid_BO1 = {
-    'n_estimators': [100, 200],
-    'max_depth': [3, 5],
-    'learning_rate': [0.01, 0.1]
-}
-grid_BO1 = GridSearchCV(xgb_BO1, param_grid_BO1, cv=3, scoring='f1', n_jobs=-1, verbose=0)
-grid_BO1.fit(X_train_BO1_scaled, y_train_BO1)
-model_BO1 = grid_BO1.best_estimator_
-
-# Sauvegarde
-joblib.dump(model_BO1, 'model_BO1.pkl')
-joblib.dump(scaler_BO1, 'scaler_BO1.pkl')
-print(f"BO1 - F1 Score: {f1_score(y_test_BO1, model_BO1.predict(X_test_BO1_scaled)):.4f}")
+def train_bo1(data, n_jobs=-1, search='grid'):
+    print("\n=== BO1 : Classification binaire ===")
+    X_BO1 = data[features_BO1]
+    y_BO1 = data['high_risk']
+
+    with stage('split', 'BO1'):
+        X_train_BO1, X_test_BO1, y_train_BO1, y_test_BO1 = train_test_split(
+            X_BO1, y_BO1, test_size=0.3, random_state=42, stratify=y_BO1
+        )
+
+    with stage('normalisation', 'BO1'):
+        scaler_BO1 = StandardScaler()
+        X_train_BO1_scaled = scaler_BO1.fit_transform(X_train_BO1)
+        X_test_BO1_scaled = scaler_BO1.transform(X_test_BO1)
+
+    # Entraînement XGBoost pour BO1
+    print("Entraînement XGBoost pour BO1...")
+    xgb_BO1 = XGBClassifier(random_state=42, n_jobs=-1, eval_metric='logloss')
+    param_grid_BO1 = {
+        'n_estimators': [100, 200],
+        'max_depth': [3, 5],
+        'learning_rate': [0.01, 0.1]
+    }
+    with stage(f'recherche {search}', 'BO1', workers=True):
+        model_BO1 = _fit_search(xgb_BO1, param_grid_BO1, 'f1', X_train_BO1_scaled, y_train_BO1, n_jobs, search)
+
+    # Sauvegarde
+    with stage('sauvegarde', 'BO1'):
+        save_xgboost(model_BO1, 'BO1', X_test_BO1_scaled)
+        joblib.dump(scaler_BO1, 'scaler_BO1.pkl')
+    with stage('évaluation', 'BO1'):
+        result = f"BO1 - F1 Score: {f1_score(y_test_BO1, model_BO1.predict(X_test_BO1_scaled)):.4f}"
+    print(result)
+    return result
+
 
 # ========== BO2 : Régression (Score de risque continu) ==========
-print("\n=== BO2 : Régression ===")
-features_BO2 = ['age', 'sysBP', 'totChol', 'BMI', 'glucose']
-X_BO2 = data[features_BO2].fillna(data[features_BO2].median())
-
-# Création du score de risque continu
-# S'assurer que toutes les colonnes nécessaires sont remplies
-for col in ['age', 'sysBP', 'totChol', 'BMI', 'glucose', 'currentSmoker', 'prevalentHyp', 'diabetes']:
-    if col in data.columns and data[col].isna().any():
-        if data[col].dtype in ['int64', 'float64']:
-            data[col].fillna(data[col].median(), inplace=True)
-        else:
-            data[col].fillna(0, inplace=True)
-
-data['cardiac_risk_score'] = (
-    data['age'] * 0.1 +
-    data['sysBP'] * 0.3 +
-    data['totChol'] * 0.2 +
-    data['BMI'] * 0.2 +
-    data['glucose'] * 0.2 +
-    data['currentSmoker'] * 10 +
-    data['prevalentHyp'] * 15 +
-    data['diabetes'] * 20
-)
-# Normalisation entre 0 et 100
-score_min = data['cardiac_risk_score'].min()
-score_max = data['cardiac_risk_score'].max()
-if score_max > score_min:
-    data['cardiac_risk_score'] = ((data['cardiac_risk_score'] - score_min) / 
-                                  (score_max - score_min) * 100)
-else:
-    data['cardiac_risk_score'] = 50  # Valeur par défaut si toutes les valeurs sont identiques
-
-# S'assurer qu'il n'y a pas de NaN
-data['cardiac_risk_score'] = data['cardiac_risk_score'].fillna(50)
-
-y_BO2 = data['cardiac_risk_score']
-
-X_train_BO2, X_test_BO2, y_train_BO2, y_test_BO2 = train_test_split(
-    X_BO2, y_BO2, test_size=0.3, random_state=42
-)
-
-scaler_BO2 = StandardScaler()
-X_train_BO2_scaled = scaler_BO2.fit_transform(X_train_BO2)
-X_test_BO2_scaled = scaler_BO2.transform(X_test_BO2)
-
-# Entraînement XGBoost Regressor pour BO2
-print("Entraînement XGBoost Regressor pour BO2...")
-xgb_BO2 = XGBRegressor(random_state=42, n_jobs=-1)
-param_grid_BO2 = {
-    'n_estimators': [100, 200],
-    'max_depth': [3, 5],
-    'learning_rate': [0.01, 0.1]
-}
-grid_BO2 = GridSearchCV(xgb_BO2, param_grid_BO2, cv=3, scoring='neg_mean_squared_error', n_jobs=-1, verbose=0)
-grid_BO2.fit(X_train_BO2_scaled, y_train_BO2)
-model_BO2 = grid_BO2.best_estimator_
-
-# Sauvegarde
-joblib.dump(model_BO2, 'model_BO2.pkl')
-joblib.dump(scaler_BO2, 'scaler_BO2.pkl')
-print(f"BO2 - R² Score: {r2_score(y_test_BO2, model_BO2.predict(X_test_BO2_scaled)):.4f}")
+def train_bo2(data, n_jobs=-1, search='grid'):
+    print("\n=== BO2 : Régression ===")
+    X_BO2 = data[features_BO2]
+    y_BO2 = data['cardiac_risk_score']
+
+    with stage('split', 'BO2'):
+        X_train_BO2, X_test_BO2, y_train_BO2, y_test_BO2 = train_test_split(
+            X_BO2, y_BO2, test_size=0.3, random_state=42
+        )
+
+    with stage('normalisation', 'BO2'):
+        scaler_BO2 = StandardScaler()
+        X_train_BO2_scaled = scaler_BO2.fit_transform(X_train_BO2)
+        X_test_BO2_scaled = scaler_BO2.transform(X_test_BO2)
+
+    # Entraînement XGBoost Regressor pour BO2
+    print("Entraînement XGBoost Regressor pour BO2...")
+    xgb_BO2 = XGBRegressor(random_state=42, n_jobs=-1)
+    param_grid_BO2 = {
+        'n_estimators': [100, 200],
+        'max_depth': [3, 5],
+        'learning_rate': [0.01, 0.1]
+    }
+    with stage(f'recherche {search}', 'BO2', workers=True):
+        model_BO2 = _fit_search(xgb_BO2, param_grid_BO2, 'neg_mean_squared_error',
+                                X_train_BO2_scaled, y_train_BO2, n_jobs, search)
+
+    # Sauvegarde
+    with stage('sauvegarde', 'BO2'):
+        save_xgboost(model_BO2, 'BO2', X_test_BO2_scaled)
+        joblib.dump(scaler_BO2, 'scaler_BO2.pkl')
+    with stage('évaluation', 'BO2'):
+        result = f"BO2 - R² Score: {r2_score(y_test_BO2, model_BO2.predict(X_test_BO2_scaled)):.4f}"
+    print(result)
+    return result
+
 
 # ========== BO3 : Classification multi-classe (Faible/Moyen/Élevé) ==========
-print("\n=== BO3 : Classification multi-classe ===")
-features_BO3 = ['age', 'sysBP', 'diaBP', 'totChol', 'BMI', 'heartRate', 'glucose', 
-                'currentSmoker', 'prevalentHyp', 'diabetes']
-X_BO3 = data[features_BO3].fillna(data[features_BO3].median())
-
-# S'assurer que cardiac_risk_score n'a pas de NaN
-data['cardiac_risk_score'] = data['cardiac_risk_score'].fillna(data['cardiac_risk_score'].median())
-
-# Création des catégories de risque basées sur le score
-y_BO3 = pd.cut(data['cardiac_risk_score'], bins=[0, 33, 66, 100], labels=[0, 1, 2], include_lowest=True)
-# Supprimer les NaN créés par pd.cut (si le score est en dehors des bins)
-y_BO3 = y_BO3.fillna(1)  # Remplacer les NaN par la catégorie moyenne
-y_BO3 = y_BO3.astype(int)
-
-X_train_BO3, X_test_BO3, y_train_BO3, y_test_BO3 = train_test_split(
-    X_BO3, y_BO3, test_size=0.3, random_state=42, stratify=y_BO3
-)
-
-scaler_BO3 = StandardScaler()
-X_train_BO3_scaled = scaler_BO3.fit_transform(X_train_BO3)
-X_test_BO3_scaled = scaler_BO3.transform(X_test_BO3)
-
-# Entraînement Random Forest pour BO3
-print("Entraînement Random Forest pour BO3...")
-rf_BO3 = RandomForestClassifier(random_state=42, n_jobs=-1)
-param_grid_BO3 = {
-    'n_estimators': [100, 200],
-    'max_depth': [5, 10],
-    'min_samples_split': [2, 5]
-}
-grid_BO3 = GridSearchCV(rf_BO3, param_grid_BO3, cv=3, scoring='f1_macro', n_jobs=-1, verbose=0)
-grid_BO3.fit(X_train_BO3_scaled, y_train_BO3)
-model_BO3 = grid_BO3.best_estimator_
-
-# Sauvegarde
-joblib.dump(model_BO3, 'model_BO3.pkl')
-joblib.dump(scaler_BO3, 'scaler_BO3.pkl')
-print(f"BO3 - Accuracy: {accuracy_score(y_test_BO3, model_BO3.predict(X_test_BO3_scaled)):.4f}")
-
-# Extraction des 5 features les plus importantes pour BO3
-feature_importance = pd.DataFrame({
-    'Feature': features_BO3,
-    'Importance': model_BO3.feature_importances_
-}).sort_values('Importance', ascending=False)
-top_5_features_BO3 = feature_importance.head(5)['Feature'].tolist()
-joblib.dump(top_5_features_BO3, 'top_5_features_BO3.pkl')
-print(f"Top 5 features BO3: {top_5_features_BO3}")
+def train_bo3(data, n_jobs=-1, search='grid'):
+    print("\n=== BO3 : Classification multi-classe ===")
+    X_BO3 = data[features_BO3]
+
+    # S'assurer que cardiac_risk_score n'a pas de NaN
+    risk_score = data['cardiac_risk_score'].fillna(data['cardiac_risk_score'].median())
+
+    # Création des catégories de risque basées sur le score
+    y_BO3 = pd.cut(risk_score, bins=[0, 33, 66, 100], labels=[0, 1, 2], include_lowest=True)
+    # Supprimer les NaN créés par pd.cut (si le score est en dehors des bins)
+    y_BO3 = y_BO3.fillna(1)  # Remplacer les NaN par la catégorie moyenne
+    y_BO3 = y_BO3.astype(int)
+
+    with stage('split', 'BO3'):
+        X_train_BO3, X_test_BO3, y_train_BO3, y_test_BO3 = train_test_split(
+            X_BO3, y_BO3, test_size=0.3, random_state=42, stratify=y_BO3
+        )
+
+    with stage('normalisation', 'BO3'):
+        scaler_BO3 = StandardScaler()
+        X_train_BO3_scaled = scaler_BO3.fit_transform(X_train_BO3)
+        X_test_BO3_scaled = scaler_BO3.transform(X_test_BO3)
+
+    # Entraînement Random Forest pour BO3
+    print("Entraînement Random Forest pour BO3...")
+    rf_BO3 = RandomForestClassifier(random_state=42, n_jobs=-1)
+    param_grid_BO3 = {
+        'n_estimators': [100, 200],
+        'max_depth': [5, 10],
+        'min_samples_split': [2, 5]
+    }
+    with stage(f'recherche {search}', 'BO3', workers=True):
+        model_BO3 = _fit_search(rf_BO3, param_grid_BO3, 'f1_macro', X_train_BO3_scaled, y_train_BO3, n_jobs, search)
+
+    # Sauvegarde
+    with stage('sauvegarde', 'BO3'):
+        joblib.dump(model_BO3, 'model_BO3.pkl')
+        joblib.dump(scaler_BO3, 'scaler_BO3.pkl')
+    with stage('évaluation', 'BO3'):
+        result = f"BO3 - Accuracy: {accuracy_score(y_test_BO3, model_BO3.predict(X_test_BO3_scaled)):.4f}"
+    print(result)
+
+    # Export de la forêt compilée en tableaux NumPy, vérifiée sur le jeu de test
+    with stage('compilation forêt', 'BO3'):
+        compiled_BO3 = CompiledForest.from_sklearn(model_BO3)
+        if not np.array_equal(compiled_BO3.predict_proba(X_test_BO3_scaled), model_BO3.predict_proba(X_test_BO3_scaled)):
+            raise RuntimeError("La forêt compilée BO3 ne reproduit pas les prédictions du modèle")
+        compiled_BO3.save('model_BO3_compiled.npz')
+
+    # Extraction des 5 features les plus importantes pour BO3
+    feature_importance = pd.DataFrame({
+        'Feature': features_BO3,
+        'Importance': model_BO3.feature_importances_
+    }).sort_values('Importance', ascending=False)
+    top_5_features_BO3 = feature_importance.head(5)['Feature'].tolist()
+    joblib.dump(top_5_features_BO3, 'top_5_features_BO3.pkl')
+    print(f"Top 5 features BO3: {top_5_features_BO3}")
+    return result
+
 
 # ========== BO4 : Clustering ==========
-print("\n=== BO4 : Clustering ===")
-features_BO4 = ['age', 'sysBP', 'totChol', 'BMI', 'currentSmoker', 'glucose']
-X_BO4 = data[features_BO4].fillna(data[features_BO4].median())
+def train_bo4(data, n_jobs=-1, search='grid'):
+    print("\n=== BO4 : Clustering ===")
+    X_BO4 = data[features_BO4]
+
+    with stage('normalisation', 'BO4'):
+        scaler_BO4 = StandardScaler()
+        X_BO4_scaled = scaler_BO4.fit_transform(X_BO4)
+
+    # Entraînement KMeans pour BO4 (KMeans utilise des threads OpenMP, bornés par n_jobs)
+    print("Entraînement KMeans pour BO4...")
+    kmeans_BO4 = KMeans(n_clusters=3, random_state=42, n_init=10)
+    with stage('KMeans', 'BO4'), threadpool_limits(limits=n_jobs if n_jobs > 0 else None):
+        kmeans_BO4.fit(X_BO4_scaled)
 
-scaler_BO4 = StandardScaler()
-X_BO4_scaled = scaler_BO4.fit_transform(X_BO4)
+    # Sauvegarde
+    with stage('sauvegarde', 'BO4'):
+        joblib.dump(kmeans_BO4, 'model_BO4.pkl')
+        joblib.dump(scaler_BO4, 'scaler_BO4.pkl')
 
-# Entraînement KMeans pour BO4
-print("Entraînement KMeans pour BO4...")
-kmeans_BO4 = KMeans(n_clusters=3, random_state=42, n_init=10)
-kmeans_BO4.fit(X_BO4_scaled)
+        # Sauvegarde des informations sur les clusters
+        cluster_centers = scaler_BO4.inverse_transform(kmeans_BO4.cluster_centers_)
+        cluster_info = pd.DataFrame(cluster_centers, columns=features_BO4)
+        cluster_info.to_csv('cluster_info_BO4.csv', index=False)
+    result = "BO4 - Clustering terminé avec 3 clusters"
+    print(result)
+    return result
 
-# Sauvegarde
-joblib.dump(kmeans_BO4, 'model_BO4.pkl')
-joblib.dump(scaler_BO4, 'scaler_BO4.pkl')
 
-# Sauvegarde des informations sur les clusters
-cluster_centers = scaler_BO4.inverse_transform(kmeans_BO4.cluster_centers_)
-cluster_info = pd.DataFrame(cluster_centers, columns=features_BO4)
-cluster_info.to_csv('cluster_info_BO4.csv', index=False)
-print("BO4 - Clustering terminé avec 3 clusters")
+TRAINERS = {'BO1': train_bo1, 'BO2': train_bo2, 'BO3': train_bo3, 'BO4': train_bo4}
 
-# Sauvegarde des features pour chaque objectif
-joblib.dump(features_BO1, 'features_BO1.pkl')
-joblib.dump(features_BO2, 'features_BO2.pkl')
-joblib.dump(features_BO3, 'features_BO3.pkl')
-joblib.dump(features_BO4, 'features_BO4.pkl')
 
-print("\n✅ Tous les modèles ont été entraînés et sauvegardés avec succès!")
+def _run_trainer(name, data, n_jobs, search):
+    """Entraîne un objectif dans un processus du pool ; renvoie (résultat, étapes mesurées)"""
+    STAGES.take()
+    return TRAINERS[name](data, n_jobs, search), STAGES.take()
+
 
+# Part relative de chaque objectif dans la durée d'un entraînement (cf. training_report.json)
+TRAINING_WEIGHTS = {'BO1': 2, 'BO2': 2, 'BO3': 6, 'BO4': 0}
+
+
+def _split_budget(n_jobs, names):
+    """Répartit un budget global de cœurs entre les entraînements simultanés des objectifs names
+
+    Le budget suit la convention de sklearn (-1 : tous les cœurs) et est borné au nombre de
+    cœurs de la machine. Chaque objectif reçoit au moins un cœur, les cœurs restants sont
+    répartis selon TRAINING_WEIGHTS et le reliquat des arrondis va à BO3, le plus long.
+    Renvoie (nombre de processus, cœurs par objectif).
+    """
+    budget = min(joblib.effective_n_jobs(n_jobs), joblib.cpu_count())
+    workers = min(len(names), budget)
+    if workers < len(names):
+        return workers, {name: 1 for name in names}
+    spare = budget - len(names)
+    total_weight = sum(TRAINING_WEIGHTS[name] for name in names)
+    jobs = {name: 1 + spare * TRAINING_WEIGHTS[name] // total_weight for name in names}
+    jobs['BO3'] += budget - sum(jobs.values())
+    return workers, jobs
+
+
+# ========== Entraînement incrémental ==========
+TRAINING_STATE_FILE = 'training_state.json'
+# Nouveaux arbres ajoutés aux modèles XGBoost à chaque mise à jour
+INCREMENTAL_ROUNDS = 20
+# Taille des mini-lots pour la mise à jour des centres BO4
+KMEANS_BATCH_SIZE = 1024
+
+
+def cluster_counts(data):
+    """Nombre de patients affectés à chaque cluster BO4 par le modèle sauvegardé"""
+    kmeans = joblib.load('model_BO4.pkl')
+    labels = kmeans.predict(joblib.load('scaler_BO4.pkl').transform(data[features_BO4]))
+    return np.bincount(labels, minlength=kmeans.n_clusters).tolist()
+
+
+def training_state(data):
+    """État nécessaire aux mises à jour incrémentales : normalisation du score et effectifs des clusters"""
+    return {'n_samples': len(data), 'score_range': raw_score_range(data), 'bo4_counts': cluster_counts(data)}
+
+
+def load_training_state(path=TRAINING_STATE_FILE):
+    """État sauvegardé, ou reconstruit depuis le jeu d'entraînement d'origine s'il manque"""
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    data, _ = load_data()
+    return training_state(data)
+
+
+def save_training_state(state, path=TRAINING_STATE_FILE):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+
+
+def _update_scaler(name, X):
+    """Met à jour moyenne et variance du scaler avec partial_fit ; renvoie (ancien, nouveau)"""
+    old = joblib.load(f'scaler_{name}.pkl')
+    return old, copy.deepcopy(old).partial_fit(X)
+
+
+def update_xgboost(name, X, y, rounds=INCREMENTAL_ROUNDS, n_jobs=-1):
+    """Poursuit le boosting du modèle sauvegardé avec rounds arbres appris sur les nouvelles données
+
+    Les seuils des arbres existants sont d'abord ramenés dans l'espace du scaler mis à jour.
+    """
+    old_scaler, scaler = _update_scaler(name, X)
+    model = rescale_xgboost(joblib.load(f'model_{name}.pkl'), old_scaler, scaler)
+    model.set_params(n_estimators=rounds, n_jobs=n_jobs)
+    model.fit(scaler.transform(X), y, xgb_model=model.get_booster())
+    model.set_params(n_jobs=-1)
+
+    save_xgboost(model, name)
+    joblib.dump(scaler, f'scaler_{name}.pkl')
+    return model, scaler
+
+
+def update_kmeans(X, counts, batch_size=KMEANS_BATCH_SIZE):
+    """Mise à jour mini-batch des centres BO4 (règle de MiniBatchKMeans, pondérée par les effectifs)
+
+    Chaque centre devient la moyenne de tous les patients qui lui ont été affectés,
+    anciens et nouveaux, sans relire les anciens. Renvoie les nouveaux effectifs.
+    """
+    old_scaler, scaler = _update_scaler('BO4', X)
+    kmeans = joblib.load('model_BO4.pkl')
+    raw_centers = old_scaler.inverse_transform(kmeans.cluster_centers_)
+    centers = scaler.transform(pd.DataFrame(raw_centers, columns=features_BO4))
+    counts = np.asarray(counts, dtype=np.float64)
+
+    X_scaled = scaler.transform(X)
+    for start in range(0, len(X_scaled), batch_size):
+        batch = X_scaled[start:start + batch_size]
+        labels = ((batch[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        for k in np.unique(labels):
+            members = batch[labels == k]
+            counts[k] += len(members)
+            centers[k] += (members.sum(axis=0) - len(members) * centers[k]) / counts[k]
+
+    kmeans.cluster_centers_ = centers
+    joblib.dump(kmeans, 'model_BO4.pkl')
+    joblib.dump(scaler, 'scaler_BO4.pkl')
+    cluster_info = pd.DataFrame(scaler.inverse_transform(centers), columns=features_BO4)
+    cluster_info.to_csv('cluster_info_BO4.csv', index=False)
+    return counts.astype(int).tolist()
+
+
+def train_incremental(path, rounds=INCREMENTAL_ROUNDS, n_jobs=-1):
+    """Met à jour BO1, BO2 et BO4 avec les nouveaux patients de path
+
+    Le coût dépend du nombre de nouveaux patients et non de l'historique. Les nouveaux
+    patients sont imputés avec les médianes et le score normalisé avec la plage de
+    l'entraînement initial. BO3 (forêt aléatoire) n'est pas incrémental et reste inchangé.
+    """
+    state = load_training_state()
+    medians = scoring.load_medians()
+    print(f"Chargement des nouveaux patients ({path})...")
+    with stage('chargement CSV'):
+        new = build_targets(scoring.impute(dataset.load_dataset(path, use_cache=False), medians),
+                            state['score_range'])
+
+    results = []
+    if new['high_risk'].nunique() < 2:
+        results.append("BO1 - inchangé (une seule classe dans les nouvelles données)")
+    else:
+        with stage('mise à jour', 'BO1'):
+            update_xgboost('BO1', new[features_BO1], new['high_risk'], rounds, n_jobs)
+        results.append(f"BO1 - {rounds} arbres ajoutés")
+    with stage('mise à jour', 'BO2'):
+        update_xgboost('BO2', new[features_BO2], new['cardiac_risk_score'], rounds, n_jobs)
+    results.append(f"BO2 - {rounds} arbres ajoutés")
+    results.append("BO3 - inchangé (réentraînement complet nécessaire)")
+    with stage('mise à jour', 'BO4'):
+        state['bo4_counts'] = update_kmeans(new[features_BO4], state['bo4_counts'])
+    results.append("BO4 - centres mis à jour")
+
+    state['n_samples'] += len(new)
+    save_training_state(state)
+    for result in results:
+        print(result)
+    return results, state['n_samples'], medians
+
+
+# ========== Entraînement hors mémoire ==========
+OUT_OF_CORE_CHUNK_SIZE = 100000
+# Hyperparamètres fixes : pas de recherche par validation croisée sur des données lues par blocs
+OUT_OF_CORE_XGB_PARAMS = {'n_estimators': 200, 'max_depth': 5, 'learning_rate': 0.1}
+
+
+def _read_chunks(path, chunk_size, medians, score_range=None):
+    """Blocs du CSV imputés avec medians ; avec score_range, les cibles sont aussi créées"""
+    for chunk in pd.read_csv(path, na_values=scoring.NA_VALUES, chunksize=chunk_size):
+        chunk = scoring.impute(chunk, medians)
+        yield chunk if score_range is None else build_targets(chunk, score_range)
+
+
+class _ChunkIterator(xgboost.DataIter):
+    """Blocs normalisés d'un objectif fournis à XGBoost, mis en cache sur disque (mémoire externe)"""
+
+    def __init__(self, path, chunk_size, medians, score_range, features, target, scaler, cache_prefix):
+        self._args = (path, chunk_size, medians, score_range)
+        self._features, self._target, self._scaler = features, target, scaler
+        self._chunks = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        input_data(data=self._scaler.transform(chunk[self._features]), label=chunk[self._target].to_numpy())
+        return True
+
+    def reset(self):
+        self._chunks = _read_chunks(*self._args)
+
+
+def _train_xgboost_out_of_core(estimator, objective, iterator):
+    """Entraîne un booster XGBoost en mémoire externe et le renvoie sous forme d'estimateur sklearn"""
+    params = estimator.get_xgb_params()
+    params.update(objective=objective, tree_method='hist')
+    booster = xgboost.train(params, xgboost.DMatrix(iterator), num_boost_round=estimator.n_estimators)
+    estimator.load_model(bytearray(booster.save_raw('json')))
+    return estimator
+
+
+def train_out_of_core(path, chunk_size=OUT_OF_CORE_CHUNK_SIZE):
+    """Entraîne BO1, BO2 et BO4 en lisant path par blocs, sans charger tout le fichier
+
+    Passes successives sur le fichier : statistiques (plage du score, scalers par
+    partial_fit), XGBoost en mémoire externe pour BO1 et BO2, MiniBatchKMeans pour BO4,
+    puis effectifs des clusters. Les médianes d'imputation sont celles déjà enregistrées,
+    sinon celles du premier bloc. BO3 (forêt aléatoire) n'est pas entraîné dans ce mode.
+    """
+    if os.path.exists(scoring.MEDIANS_FILE):
+        medians = scoring.load_medians()
+    else:
+        medians = scoring.fit_medians(next(pd.read_csv(path, na_values=scoring.NA_VALUES, chunksize=chunk_size)))
+
+    print(f"\nPasse 1 : statistiques et scalers ({path})...")
+    scalers = {'BO1': StandardScaler(), 'BO2': StandardScaler(), 'BO4': StandardScaler()}
+    features = {'BO1': features_BO1, 'BO2': features_BO2, 'BO4': features_BO4}
+    n_samples, score_min, score_max = 0, np.inf, -np.inf
+    with stage('passe statistiques'):
+        for chunk in _read_chunks(path, chunk_size, medians):
+            n_samples += len(chunk)
+            chunk_min, chunk_max = raw_score_range(chunk)
+            score_min, score_max = min(score_min, chunk_min), max(score_max, chunk_max)
+            for name, scaler in scalers.items():
+                scaler.partial_fit(chunk[features[name]])
+    score_range = (score_min, score_max)
+
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, estimator, objective, target in [
+            ('BO1', XGBClassifier(random_state=42, n_jobs=-1, eval_metric='logloss', **OUT_OF_CORE_XGB_PARAMS),
+             'binary:logistic', 'high_risk'),
+            ('BO2', XGBRegressor(random_state=42, n_jobs=-1, **OUT_OF_CORE_XGB_PARAMS),
+             'reg:squarederror', 'cardiac_risk_score')
+        ]:
+            print(f"Passe XGBoost {name} (mémoire externe)...")
+            iterator = _ChunkIterator(path, chunk_size, medians, score_range, features[name], target,
+                                      scalers[name], os.path.join(cache_dir, name))
+            with stage('passe XGBoost', name):
+                model = _train_xgboost_out_of_core(estimator, objective, iterator)
+            with stage('sauvegarde', name):
+                save_xgboost(model, name)
+                joblib.dump(scalers[name], f'scaler_{name}.pkl')
+            results.append(f"{name} - entraîné hors mémoire sur {n_samples} patients")
+
+    print("Passe MiniBatchKMeans BO4...")
+    kmeans = MiniBatchKMeans(n_clusters=3, random_state=42, n_init=3)
+    with stage('passe MiniBatchKMeans', 'BO4'):
+        for chunk in _read_chunks(path, chunk_size, medians):
+            kmeans.partial_fit(scalers['BO4'].transform(chunk[features_BO4]))
+    counts = np.zeros(kmeans.n_clusters, dtype=int)
+    with stage('passe effectifs', 'BO4'):
+        for chunk in _read_chunks(path, chunk_size, medians):
+            counts += np.bincount(kmeans.predict(scalers['BO4'].transform(chunk[features_BO4])),
+                                  minlength=kmeans.n_clusters)
+    joblib.dump(kmeans, 'model_BO4.pkl')
+    joblib.dump(scalers['BO4'], 'scaler_BO4.pkl')
+    cluster_info = pd.DataFrame(scalers['BO4'].inverse_transform(kmeans.cluster_centers_), columns=features_BO4)
+    cluster_info.to_csv('cluster_info_BO4.csv', index=False)
+    results.append(f"BO4 - MiniBatchKMeans sur {n_samples} patients")
+    results.append("BO3 - inchangé (forêt aléatoire non entraînable par blocs)")
+
+    scoring.save_medians(medians)
+    save_training_state({'n_samples': n_samples, 'score_range': list(score_range), 'bo4_counts': counts.tolist()})
+    for result in results:
+        print(result)
+    return results, n_samples, medians
+
+
+def train_full(args):
+    """Entraînement complet des quatre objectifs ; renvoie (résultats, nombre de patients, médianes)"""
+    data, medians = load_data(use_cache=not args.no_data_cache)
+    with stage('cibles'):
+        data = build_targets(data)
+    scoring.save_medians(medians)
+
+    if args.parallel:
+        workers, jobs = _split_budget(args.n_jobs or -1, list(TRAINERS))
+        print(f"\nEntraînement parallèle : {workers} processus, cœurs par objectif : "
+              f"{', '.join(f'{name} {n}' for name, n in jobs.items())}")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {name: executor.submit(_run_trainer, name, data, jobs[name], args.search)
+                       for name in TRAINERS}
+            results = []
+            for name in TRAINERS:
+                result, stages = futures[name].result()
+                results.append(result)
+                STAGES.stages.extend(stages)
+        print("\n=== Résultats ===")
+        for result in results:
+            print(result)
+    else:
+        results = [train(data, args.n_jobs or -1, args.search) for train in TRAINERS.values()]
+
+    # État utilisé par les mises à jour incrémentales suivantes
+    with stage('état incrémental'):
+        save_training_state(training_state(data))
+    return results, len(data), medians
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entraînement des modèles BO1 à BO4")
+    parser.add_argument('--parallel', action='store_true',
+                        help="entraîner les objectifs simultanément dans un pool de processus")
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help="budget global de cœurs CPU, borné au nombre de cœurs (par défaut ou -1 : tous les cœurs)")
+    parser.add_argument('--search', choices=SEARCH_STRATEGIES, default='grid',
+                        help="stratégie de recherche des hyperparamètres")
+    parser.add_argument('--no-data-cache', action='store_true',
+                        help="relire le CSV sans passer par le cache colonnaire")
+    parser.add_argument('--fused', action='store_true',
+                        help="intégrer les scalers aux modèles du bundle (features brutes en entrée)")
+    parser.add_argument('--incremental', metavar='CSV', default=None,
+                        help="mettre à jour les modèles existants avec les nouveaux patients de CSV")
+    parser.add_argument('--rounds', type=int, default=INCREMENTAL_ROUNDS,
+                        help="arbres XGBoost ajoutés par mise à jour incrémentale")
+    parser.add_argument('--out-of-core', metavar='CSV', default=None,
+                        help="entraîner BO1, BO2 et BO4 en lisant CSV par blocs (données plus grandes que la mémoire)")
+    parser.add_argument('--chunk-size', type=int, default=OUT_OF_CORE_CHUNK_SIZE,
+                        help="lignes lues par bloc en mode --out-of-core")
+    args = parser.parse_args()
+    started = time.perf_counter()
+
+    if args.incremental:
+        results, n_samples, medians = train_incremental(args.incremental, args.rounds, args.n_jobs or -1)
+    elif args.out_of_core:
+        results, n_samples, medians = train_out_of_core(args.out_of_core, args.chunk_size)
+    else:
+        results, n_samples, medians = train_full(args)
+
+    # Sauvegarde des features pour chaque objectif
+    with stage('sauvegarde features'):
+        joblib.dump(features_BO1, 'features_BO1.pkl')
+        joblib.dump(features_BO2, 'features_BO2.pkl')
+        joblib.dump(features_BO3, 'features_BO3.pkl')
+        joblib.dump(features_BO4, 'features_BO4.pkl')
+
+    # Bundle versionné regroupant tous les artefacts en un seul fichier
+    with stage('bundle'):
+        models = scoring.load_legacy_models()
+        if args.fused:
+            for entry in models.values():
+                entry['model'] = fuse_scaler(entry['model'], entry['scaler'])
+                entry['fused'] = True
+        manifest = model_bundle.save_bundle(models, model_bundle.BUNDLE_FILE, {
+            'n_samples': n_samples,
+            'search': args.search,
+            'incremental': args.incremental,
+            'out_of_core': args.out_of_core,
+            'fused': args.fused,
+            'results': results,
+            'sklearn_version': sklearn.__version__,
+            'xgboost_version': xgboost.__version__,
+            'pandas_version': pd.__version__
+        }, medians)
+        # Même contenu en mémoire mappée, partagé par les processus de l'application
+        model_bundle.save_shared(models, model_bundle.SHARED_DIR, manifest['model_version'], medians)
+    print(f"Bundle {model_bundle.BUNDLE_FILE} et modèles partagés {model_bundle.SHARED_DIR}/ "
+          f"écrits (version {manifest['model_version']})")
+
+    # Rapport des durées, temps CPU et mémoire de chaque étape, à côté des artefacts
+    stages = STAGES.take()
+    run_report.write_report(stages, started, mode='incremental' if args.incremental else
+                            'out_of_core' if args.out_of_core else 'parallel' if args.parallel else 'sequential',
+                            model_version=manifest['model_version'], n_samples=n_samples, results=results)
+    print(f"\nRapport d'exécution écrit dans {run_report.REPORT_FILE}, étapes les plus longues :")
+    for line in run_report.summary(stages):
+        print(f"  - {line}")
+
+    print("\n✅ Tous les modèles ont été entraînés et sauvegardés avec succès!")
+
+
+if __name__ == '__main__':
+    main()